@@ -0,0 +1,148 @@
+"""
+Admission control for the expensive routes.
+
+Each limited view has a fixed number of concurrency slots and a bounded
+number of waiting slots, both shared by every worker process on the host.
+A slot is an exclusive ``flock`` on a small file in ``ADMISSION_FOLDER``, so
+it is released by the kernel if a worker dies while holding it. A request
+that finds every slot busy takes a waiting slot and polls for up to
+``ADMISSION_MAX_WAIT`` seconds; if no waiting slot is free, or the wait runs
+out, it gets a fast 503 with Retry-After.
+
+Clients can also be rate-limited per address with a token bucket stored in
+a small SQLite database next to the lock files (429 with Retry-After) by
+setting ``RATE_LIMIT_PER_MINUTE``. Behind a reverse proxy, set
+``TRUSTED_PROXIES`` to the number of proxies as well, so that the address is
+the client's from ``X-Forwarded-For`` and not the proxy's.
+
+Admission control is skipped on platforms without ``fcntl`` (Windows).
+"""
+
+import logging
+import math
+import os
+import random
+import sqlite3
+import time
+from functools import wraps
+
+from flask import current_app, render_template, request
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Seconds between attempts to take a slot while waiting
+POLL_INTERVAL = 0.05
+
+_rate_limit_ready = set()
+
+
+def _try_lock(path):
+    """Take an exclusive lock on ``path`` without blocking; return the open file or None."""
+    f = open(path, 'a')
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        f.close()
+        return None
+    return f
+
+
+def _release(f):
+    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    f.close()
+
+
+def _try_slot(folder, name, kind, count):
+    """Take any free slot of a kind, starting at a random one to spread contention."""
+    offset = random.randrange(count)
+    for i in range(count):
+        slot = (offset + i) % count
+        f = _try_lock(os.path.join(folder, f"{name}.{kind}.{slot}.lock"))
+        if f is not None:
+            return f
+    return None
+
+
+def acquire_slot(folder, name, limit, max_waiters, max_wait):
+    """Take a concurrency slot for ``name``, waiting in a bounded queue; None when saturated."""
+    slot = _try_slot(folder, name, 'run', limit)
+    if slot is not None or max_waiters <= 0:
+        return slot
+    waiter = _try_slot(folder, name, 'wait', max_waiters)
+    if waiter is None:
+        return None
+    try:
+        deadline = time.monotonic() + max_wait
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            slot = _try_slot(folder, name, 'run', limit)
+            if slot is not None:
+                return slot
+        return None
+    finally:
+        _release(waiter)
+
+
+def take_token(folder, client, per_minute):
+    """Take one token from a client's bucket; return 0 when allowed, else seconds to wait."""
+    path = os.path.join(folder, 'ratelimit.sqlite')
+    conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+    try:
+        if path not in _rate_limit_ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS bucket "
+                         "(client TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+            _rate_limit_ready.add(path)
+        now = time.time()
+        rate = per_minute / 60.0
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT tokens, updated FROM bucket WHERE client = ?", (client,)).fetchone()
+        tokens = per_minute if row is None else min(per_minute, row[0] + (now - row[1]) * rate)
+        wait = 0 if tokens >= 1 else (1 - tokens) / rate
+        if not wait:
+            tokens -= 1
+        conn.execute("INSERT OR REPLACE INTO bucket (client, tokens, updated) VALUES (?, ?, ?)",
+                     (client, tokens, now))
+        if random.random() < 0.01:
+            # A bucket untouched for a minute is full again and carries no state
+            conn.execute("DELETE FROM bucket WHERE updated < ?", (now - 60,))
+        conn.execute("COMMIT")
+        return wait
+    finally:
+        conn.close()
+
+
+def admitted(view):
+    """Apply the per-client rate limit and the route's concurrency limit to a view."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        config = current_app.config
+        limit = config['ADMISSION_LIMITS'].get(view.__name__)
+        if fcntl is None or not limit:
+            return view(*args, **kwargs)
+        folder = config['ADMISSION_FOLDER']
+
+        if config['RATE_LIMIT_PER_MINUTE'] > 0:
+            wait = take_token(folder, request.remote_addr or 'unknown', config['RATE_LIMIT_PER_MINUTE'])
+            if wait:
+                logger.info("Rate limited %s on %s", request.remote_addr, view.__name__,
+                            extra={'throttle': 'rate-limited'})
+                return render_template('error.html', message="Too many requests. Please wait a moment and try again."), \
+                    429, {'Retry-After': str(math.ceil(wait))}
+
+        slot = acquire_slot(folder, view.__name__, limit, config['ADMISSION_MAX_WAITERS'], config['ADMISSION_MAX_WAIT'])
+        if slot is None:
+            logger.warning("Rejected %s: all %s slots busy", view.__name__, limit,
+                           extra={'throttle': 'saturated'})
+            return render_template('error.html', message="The server is busy. Please try again shortly."), \
+                503, {'Retry-After': str(config['ADMISSION_RETRY_AFTER'])}
+        try:
+            return view(*args, **kwargs)
+        finally:
+            _release(slot)
+    return wrapper
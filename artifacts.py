@@ -0,0 +1,62 @@
+"""
+Names and storage of artifacts derived from templates.
+
+Every derived artifact (baked template pack, preview snapshot, thumbnail) is
+named after the template id and ``template_cache_key``, which changes with
+the template version and content hash, so a new version never reads a stale
+artifact and old ones can be removed by prefix. This module has no python-docx dependency.
+"""
+
+import json
+import logging
+import os
+import uuid
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+
+def template_cache_key(template, template_file_path):
+    """Return a key for artifacts derived from this version of a template."""
+    content = template.content_hash
+    if content is None:
+        # Templates stored by file name before content addressing can be overwritten in place
+        content = f"m{os.stat(template_file_path).st_mtime_ns}"
+    return f"v{template.version or 1}_{content[:16]}"
+
+
+def artifact_path(template, template_file_path, suffix):
+    """Return the path of one artifact of a template version, e.g. suffix '.pack'."""
+    key = template_cache_key(template, template_file_path)
+    return os.path.join(current_app.config['BAKED_FOLDER'], f"template_{template.id}_{key}{suffix}")
+
+
+def template_pack_path(template, template_file_path):
+    """Return the path of the pack (see sharedcache) of the baked variant of a template version."""
+    return artifact_path(template, template_file_path, '.pack')
+
+
+def preview_snapshot_path(template, template_file_path):
+    """Return the path of the preview snapshot of a template version."""
+    return artifact_path(template, template_file_path, '.preview.json')
+
+
+def write_json_atomic(path, data):
+    """Write JSON under a temporary name and move it into place."""
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(temp_path, path)
+
+
+def remove_baked_templates(template_id, keep_key=None):
+    """Delete the artifacts of every version of a template except ``keep_key``."""
+    prefix = f"template_{template_id}_"
+    keep = f"{prefix}{keep_key}." if keep_key else None
+    for name in os.listdir(current_app.config['BAKED_FOLDER']):
+        if name.startswith(prefix) and not (keep and name.startswith(keep)):
+            try:
+                os.remove(os.path.join(current_app.config['BAKED_FOLDER'], name))
+            except OSError as e:
+                logger.warning(f"Could not remove baked template {name}: {str(e)}")
@@ -0,0 +1 @@
+"""Benchmarks and performance harnesses for MyTypist."""
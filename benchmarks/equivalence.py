@@ -0,0 +1,682 @@
+#!/usr/bin/env python3
+"""
+Check that a candidate render path produces the same documents as generate().
+
+Every template in ``uploads/`` known to the database is rendered over a
+corpus of generated inputs: sample and empty values plus ``--cases`` random
+picks per template from values chosen for each placeholder type (date
+ordinals, addresses with missing or doubled separators, mixed case and
+padded text). Each input set is rendered as a letter and an affidavit, with
+the placeholders' stored casing and with every casing rule, after the same
+validation as ``/generate``.
+
+The reference is the current generate() logic, ``rendering.render_document``
+from a scratch baked folder. The other side is one of:
+
+- ``--candidate``: a render function, either ``module:function`` with the
+  signature of ``render_document`` or a built-in one:
+
+  - ``original`` (the default): the original generate(), with its own copy
+    of the substitution (dates, letter addresses, casing) and of the
+    separate post-processing passes, sharing no code with formatting.py,
+    bake_document or finish_document
+  - ``unfused``: fill_placeholders followed by the original
+    post-processing passes; only covers baking and the fused
+    finish_document (with ``--strict``, as written)
+  - ``unbaked``: baking in memory on every render; only covers the packs
+- ``--baseline REV``: another git revision, any from the first one on.
+  Its own app is imported from a temporary worktree holding copies of the
+  current database and uploads, and each case is posted to its ``/generate``
+  through the test client, with the template type and casings of the case
+  set in the copied database; the documents it saves are compared
+- ``--against DIR``: renders stored earlier with ``--write DIR``
+
+``word/document.xml``, the headers, footers and ``word/styles.xml`` are
+normalized before they are compared: rsid attributes, proofing marks and
+empty runs are dropped, adjacent runs with the same properties are merged
+and ``xml:space`` is kept only where it changes the text. ``--strict``
+compares the parts as written, apart from attribute order. Each differing
+element is reported with its path in the part.
+
+Usage:
+    python -m benchmarks.equivalence
+    python -m benchmarks.equivalence --candidate mymodule:render_fast
+    python -m benchmarks.equivalence --baseline HEAD~1
+    python -m benchmarks.equivalence --write /tmp/before && python -m benchmarks.equivalence --against /tmp/before
+"""
+
+import argparse
+import importlib
+import io
+import json
+import logging
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+from difflib import SequenceMatcher
+
+from dateutil.parser import parse as parse_date
+from docx import Document
+from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_LINE_SPACING
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+from docx.shared import Inches, Pt, RGBColor
+from flask import current_app
+from lxml import etree
+
+import rendering
+from app import create_app
+from models import Placeholder, Template
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+W = f"{{{W_NS}}}"
+XML_SPACE = '{http://www.w3.org/XML/1998/namespace}space'
+
+COMPARED_PARTS = re.compile(r'^/word/(document|styles|header\d*|footer\d*)\.xml$')
+
+# Markup Word adds while editing that does not change the document
+IGNORED_ELEMENTS = (f"{W}proofErr", f"{W}lastRenderedPageBreak")
+
+TEMPLATE_TYPES = ('letter', 'affidavit')
+CASINGS = (None, 'upper', 'lower', 'title')
+
+# Values per placeholder type; the first is the sample value
+VALUES = {
+    'text': ['Adaeze Chinwe Okafor', 'DECLARATION OF AGE', "o'neil-ogbonna", 'Dated: yours faithfully',
+             '  padded value  ', 'Ọláńrewájú Ẹ̀kọ́', 'x'],
+    'date': ['2024-03-02', '2024-03-01', '2024-03-03', '2024-03-11', '2024-03-12', '2024-03-13',
+             '2024-03-21', '2024-03-22', '2024-03-23', '2024-03-31', '14/07/2003', '5 March 2024'],
+    'address': ['12 Ugbowo Road, Benin City, Edo State', '12 Ugbowo Road,, Benin City',
+                'Block 4. Ugbowo, Benin City.', '7 Ekehuan Rd., Benin City', 'Benin City', ' 3 Airport Road , GRA ,Benin ',
+                'Plot 7, Sapele Road, Benin City, Edo State, Nigeria'],
+    'number': ['1', '1,000', '250000', '12.5'],
+}
+
+
+# The substitution and post-processing passes of the original generate(), an
+# independent reference for formatting.py and for the baked, fused passes of
+# rendering.py. Since then only the stored placeholder types (names are used
+# for placeholders without one, as before) and number grouping were added.
+
+def _ordinal(n):
+    if 11 <= (n % 100) <= 13:
+        suffix = 'th'
+    else:
+        suffix = ['th', 'st', 'nd', 'rd', 'th'][min(n % 10, 4)]
+    return str(n) + suffix
+
+
+def _original_date(date_string, template_type):
+    try:
+        date_obj = parse_date(date_string)
+    except (ValueError, OverflowError):
+        return date_string
+    day = _ordinal(date_obj.day)
+    month = date_obj.strftime("%B")
+    if template_type == "letter":
+        return f"{day} {month}, {date_obj.year}"
+    elif template_type == "affidavit":
+        return f"{day} of {month}, {date_obj.year}"
+    return f"{date_obj.day} {month} {date_obj.year}"
+
+
+def _original_number(value):
+    digits = value.replace(',', '').replace(' ', '')
+    if not re.fullmatch(r'-?\d+(?:\.\d+)?', digits):
+        return value
+    negative, digits = digits.startswith('-'), digits.lstrip('-')
+    whole, _, fraction = digits.partition('.')
+    whole = whole.lstrip('0') or '0'
+    groups = []
+    while len(whole) > 3:
+        whole, group = whole[:-3], whole[-3:]
+        groups.insert(0, group)
+    text = ','.join([whole] + groups) + (f".{fraction}" if fraction else '')
+    return f"-{text}" if negative else text
+
+
+def _original_type(placeholder):
+    if placeholder.value_type:
+        return placeholder.value_type
+    name = placeholder.name.lower()
+    return 'date' if 'date' in name else 'address' if 'address' in name else 'text'
+
+
+def _format_run(run, template, placeholder):
+    run.font.name = template.font_family
+    run.font.size = Pt(template.font_size)
+    run.bold = placeholder.bold
+    run.italic = placeholder.italic
+    run.underline = placeholder.underline
+
+
+def _original_fill(doc, template, user_inputs, placeholders):
+    for placeholder in placeholders:
+        if not 0 <= placeholder.paragraph_index < len(doc.paragraphs):
+            continue
+        paragraph = doc.paragraphs[placeholder.paragraph_index]
+        if placeholder.start_run_index >= len(paragraph.runs) or placeholder.end_run_index >= len(paragraph.runs):
+            continue
+
+        user_input = user_inputs.get(placeholder.name, "")
+        formatted_text = user_input
+        value_type = _original_type(placeholder)
+
+        if value_type == 'date':
+            formatted_text = _original_date(user_input, template.type)
+
+        elif value_type == 'number':
+            formatted_text = _original_number(user_input)
+
+        elif value_type == 'address' and template.type == "letter":
+            parts = [part.strip() for part in user_input.split(",")]
+            if parts:
+                if placeholder.start_run_index != placeholder.end_run_index:
+                    for r_idx in range(placeholder.start_run_index + 1, placeholder.end_run_index + 1):
+                        paragraph.runs[r_idx].text = ""
+                run = paragraph.runs[placeholder.start_run_index]
+                run.clear()
+                for i, part in enumerate(parts):
+                    run.add_text(part)
+                    if i == len(parts) - 1 or part.endswith("."):
+                        if not part.endswith("."):
+                            run.add_text(".")
+                        break
+                    else:
+                        run.add_text(",")
+                        run.add_break()
+                _format_run(run, template, placeholder)
+                continue
+
+        else:
+            if placeholder.casing == "upper":
+                formatted_text = formatted_text.upper()
+            elif placeholder.casing == "lower":
+                formatted_text = formatted_text.lower()
+            elif placeholder.casing == "title":
+                formatted_text = formatted_text.title()
+
+        run = paragraph.runs[placeholder.start_run_index]
+        if placeholder.start_run_index != placeholder.end_run_index:
+            for r_idx in range(placeholder.start_run_index + 1, placeholder.end_run_index + 1):
+                paragraph.runs[r_idx].text = ""
+        run.text = formatted_text
+        _format_run(run, template, placeholder)
+
+
+def _original_remove_empty_runs(doc):
+    for para in doc.paragraphs:
+        p = para._element
+        for run in list(p.findall('.//w:r', namespaces=p.nsmap)):
+            t = run.find('.//w:t', namespaces=run.nsmap)
+            if t is not None and t.text == '':
+                p.remove(run)
+
+
+def _original_formatting(doc, template_type):
+    try:
+        normal_style = doc.styles['Normal']
+        if not normal_style.font.name:
+            normal_style.font.name = 'Times New Roman'
+        if not normal_style.font.size:
+            normal_style.font.size = Pt(12)
+        normal_style.paragraph_format.space_after = Pt(6)
+        normal_style.paragraph_format.line_spacing_rule = WD_LINE_SPACING.SINGLE
+    except KeyError:
+        pass
+
+    for paragraph in doc.paragraphs:
+        if paragraph.paragraph_format.space_after is None:
+            paragraph.paragraph_format.space_after = Pt(6)
+        if paragraph.paragraph_format.line_spacing_rule is None:
+            paragraph.paragraph_format.line_spacing_rule = WD_LINE_SPACING.SINGLE
+        for run in paragraph.runs:
+            if run.font.name is None:
+                run.font.name = 'Times New Roman'
+            if run.font.size is None:
+                run.font.size = Pt(12)
+
+    for section in doc.sections:
+        section.top_margin = Inches(1)
+        section.bottom_margin = Inches(1)
+        section.left_margin = Inches(1)
+        section.right_margin = Inches(1)
+
+    for para in doc.paragraphs:
+        if not para.text.strip():
+            continue
+        para.paragraph_format.space_before = Pt(6)
+        para.paragraph_format.space_after = Pt(6)
+        para.paragraph_format.line_spacing = 1.15
+        if template_type == "letter":
+            if any(word in para.text.lower() for word in ["date:", "dated:"]):
+                para.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.RIGHT
+            elif any(word in para.text.lower() for word in ["sincerely", "regards", "yours", "faithfully"]):
+                para.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.RIGHT
+        elif template_type == "affidavit":
+            if "affidavit" in para.text.lower() or "declaration" in para.text.lower():
+                para.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.CENTER
+                for run in para.runs:
+                    run.bold = True
+        if len(para.text) < 50 and para.text.isupper():
+            para.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.CENTER
+            para.paragraph_format.space_before = Pt(12)
+            para.paragraph_format.space_after = Pt(12)
+
+
+def _original_page_numbers(doc):
+    for section in doc.sections:
+        footer = section.footer
+        paragraph = footer.paragraphs[0] if footer.paragraphs else footer.add_paragraph()
+        paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
+        run = paragraph.add_run()
+        begin = OxmlElement('w:fldChar')
+        begin.set(qn('w:fldCharType'), 'begin')
+        instruction = OxmlElement('w:instrText')
+        instruction.set(qn('xml:space'), 'preserve')
+        instruction.text = "PAGE"
+        end = OxmlElement('w:fldChar')
+        end.set(qn('w:fldCharType'), 'end')
+        run._r.append(begin)
+        run._r.append(instruction)
+        run._r.append(end)
+        run.font.size = Pt(9)
+        run.font.name = "Arial"
+        run.font.color.rgb = RGBColor(128, 128, 128)
+
+
+def _original_postprocess(doc, template):
+    _original_remove_empty_runs(doc)
+    _original_formatting(doc, template.type)
+    _original_page_numbers(doc)
+
+
+# Candidate render paths; each takes the arguments of rendering.render_document
+
+def render_original(template_file_path, template, user_inputs, placeholders):
+    """Render the way the original generate() did, without any code shared with fill_placeholders."""
+    doc = Document(template_file_path)
+    doc.styles['Normal'].font.name = template.font_family
+    doc.styles['Normal'].font.size = Pt(template.font_size)
+    _original_fill(doc, template, user_inputs, placeholders)
+    _original_postprocess(doc, template)
+    return doc
+
+
+def render_unfused(template_file_path, template, user_inputs, placeholders):
+    """Fill with fill_placeholders, then run the original post-processing passes instead of baking and finish_document."""
+    doc = Document(template_file_path)
+    rendering.set_default_font(doc, template.font_family, template.font_size)
+    rendering.fill_placeholders(doc, template, user_inputs, placeholders)
+    _original_postprocess(doc, template)
+    return doc
+
+
+def render_unbaked(template_file_path, template, user_inputs, placeholders):
+    """Bake the template in memory on every render, bypassing the baked packs."""
+    doc = Document(template_file_path)
+    rendering.bake_document(doc, template.font_family, template.font_size)
+    rendering.fill_placeholders(doc, template, user_inputs, placeholders)
+    rendering.finish_document(doc, template.type)
+    return doc
+
+
+CANDIDATES = {'original': render_original, 'unfused': render_unfused, 'unbaked': render_unbaked}
+
+
+def load_candidate(spec):
+    """Return a built-in candidate by name or a ``module:function``."""
+    if spec in CANDIDATES:
+        return CANDIDATES[spec]
+    module_name, _, function_name = spec.partition(':')
+    if not function_name:
+        raise SystemExit(f"candidate must be one of {', '.join(CANDIDATES)} or module:function, not {spec!r}")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def _copy(instance, **changes):
+    """Return a detached copy of a model row with some columns changed."""
+    columns = {column.name: getattr(instance, column.name) for column in instance.__table__.columns}
+    columns.update(changes)
+    return type(instance)(**columns)
+
+
+def _templates():
+    """Return ``{id: (template, placeholders)}`` for every template whose file is in the upload folder."""
+    templates = {}
+    for template in Template.query.order_by(Template.id).all():
+        if not os.path.exists(os.path.join(current_app.config['UPLOAD_FOLDER'], template.file_path)):
+            continue
+        placeholders = Placeholder.query.filter_by(template_id=template.id)\
+            .order_by(Placeholder.paragraph_index, Placeholder.start_run_index).all()
+        templates[template.id] = (template, placeholders)
+    return templates
+
+
+def build_corpus(cases, seed):
+    """Generate the input sets of every template; returns a list of JSON-ready cases."""
+    from formatting import placeholder_type, validate_inputs
+    from benchmarks.synthetic import SAMPLE_INPUTS
+
+    corpus = []
+    for template_id, (template, placeholders) in _templates().items():
+        types = {ph.name: placeholder_type(ph) for ph in placeholders}
+        pick = random.Random(f"{seed}:{template_id}")
+        input_sets = {
+            'sample': {name: SAMPLE_INPUTS.get(name) if kind == 'text' and name in SAMPLE_INPUTS
+                       else VALUES[kind][0] for name, kind in types.items()},
+            'empty': {name: '' for name in types},
+        }
+        for index in range(cases):
+            input_sets[f"random{index}"] = {name: pick.choice(VALUES[kind]) for name, kind in types.items()}
+        for set_name, inputs in input_sets.items():
+            # generate() renders only what passes validation, with typed values stripped
+            inputs, errors = validate_inputs(placeholders, inputs)
+            if errors:
+                continue
+            for template_type in TEMPLATE_TYPES:
+                for casing in CASINGS:
+                    corpus.append({'id': f"{template_id}-{template_type}-{casing or 'stored'}-{set_name}",
+                                   'template_id': template_id, 'template_type': template_type,
+                                   'casing': casing, 'inputs': inputs})
+    return corpus
+
+
+def normalize_part(blob, strict=False):
+    """Return a part's XML in canonical form, normalized unless ``strict``."""
+    root = etree.fromstring(blob)
+    if not strict:
+        etree.strip_elements(root, *IGNORED_ELEMENTS, with_tail=False)
+        for element in root.iter():
+            for name in [name for name in element.attrib if name.startswith(f"{W}rsid")]:
+                del element.attrib[name]
+        for text in root.iter(f"{W}t"):
+            # Without xml:space="preserve" Word drops the spaces around the text
+            value = text.text or ''
+            _set_text(text, value if text.get(XML_SPACE) == 'preserve' else value.strip())
+        for parent in {run.getparent() for run in root.iter(f"{W}r")}:
+            _merge_runs(parent)
+    return etree.tostring(root, method='c14n')
+
+
+def _set_text(text, value):
+    text.text = value
+    if value != value.strip():
+        text.set(XML_SPACE, 'preserve')
+    elif XML_SPACE in text.attrib:
+        del text.attrib[XML_SPACE]
+
+
+def _merge_runs(parent):
+    """Drop empty text runs and merge adjacent ones with the same properties."""
+    previous = previous_key = None
+    for child in list(parent):
+        content = [node.tag for node in child if node.tag != f"{W}rPr"]
+        if child.tag != f"{W}r" or any(tag != f"{W}t" for tag in content):
+            previous = None
+            continue
+        properties = child.find(f"{W}rPr")
+        texts = child.findall(f"{W}t")
+        value = ''.join(text.text or '' for text in texts)
+        if not value:
+            parent.remove(child)
+            continue
+        key = etree.tostring(properties, method='c14n') if properties is not None else b''
+        if previous is not None and key == previous_key:
+            target = previous.find(f"{W}t")
+            _set_text(target, target.text + value)
+            parent.remove(child)
+            continue
+        for extra in texts[1:]:
+            child.remove(extra)
+        _set_text(texts[0], value)
+        previous, previous_key = child, key
+
+
+def document_parts(docx, strict=False):
+    """Return the compared parts of a saved .docx (path or file object), normalized."""
+    package = Document(docx).part.package
+    return {str(part.partname): normalize_part(part.blob, strict).decode('utf-8')
+            for part in package.iter_parts() if COMPARED_PARTS.match(str(part.partname))}
+
+
+def render_parts(doc, strict=False):
+    """Save a document and return its compared parts, normalized."""
+    # Saving and reloading gives the parts exactly as a generated file holds them
+    saved = io.BytesIO()
+    doc.save(saved)
+    saved.seek(0)
+    return document_parts(saved, strict)
+
+
+def render_case(render, case, templates, strict=False):
+    """Render one corpus case with ``render`` and return its normalized parts."""
+    template, placeholders = templates[case['template_id']]
+    variant = _copy(template, type=case['template_type'])
+    if case['casing']:
+        placeholders = [_copy(ph, casing=case['casing']) for ph in placeholders]
+    template_file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], template.file_path)
+    return render_parts(render(template_file_path, variant, dict(case['inputs']), placeholders), strict)
+
+
+def _element_name(element, name=None):
+    """Return ``prefix:local`` for an element or one of its attributes."""
+    qname = etree.QName(name or element.tag)
+    prefixes = {uri: prefix for prefix, uri in element.nsmap.items()}
+    prefix = prefixes.get(qname.namespace, 'xml' if qname.namespace and 'XML/1998' in qname.namespace else None)
+    return f"{prefix}:{qname.localname}" if prefix else qname.localname
+
+
+def diff_elements(expected, actual, path, differences, limit):
+    """Walk two trees in step and append a line per differing element, up to ``limit``."""
+    if len(differences) >= limit:
+        return
+    if expected.tag != actual.tag:
+        differences.append(f"{path}: {_element_name(expected)} became {_element_name(actual)}")
+        return
+    for name in sorted(set(expected.attrib) | set(actual.attrib)):
+        old, new = expected.get(name), actual.get(name)
+        if old != new:
+            differences.append(f"{path}/@{_element_name(expected, name)}: {old!r} became {new!r}")
+    if (expected.text or '') != (actual.text or ''):
+        differences.append(f"{path}/text(): {expected.text!r} became {actual.text!r}")
+
+    # Pair the children by tag so that one inserted element is reported once, not as a shift
+    old_children, new_children = list(expected), list(actual)
+    matcher = SequenceMatcher(None, [child.tag for child in old_children], [child.tag for child in new_children],
+                              autojunk=False)
+    for op, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        if op == 'equal':
+            for old_child, new_child in zip(old_children[old_start:old_end], new_children[new_start:new_end]):
+                diff_elements(old_child, new_child, f"{path}/{_step(old_child)}", differences, limit)
+            continue
+        for old_child in old_children[old_start:old_end]:
+            differences.append(f"{path}/{_step(old_child)}: missing")
+        for new_child in new_children[new_start:new_end]:
+            differences.append(f"{path}/{_step(new_child)}: added")
+    del differences[limit:]
+
+
+def _step(element):
+    """Return an element's XPath step, e.g. ``w:p[3]`` for the third paragraph of its parent."""
+    position = 1 + sum(1 for sibling in element.itersiblings(preceding=True) if sibling.tag == element.tag)
+    return f"{_element_name(element)}[{position}]"
+
+
+def diff_parts(expected, actual, limit):
+    """Return the differences between two ``{part name: XML}`` dicts, at most ``limit`` per part."""
+    differences = []
+    for name in sorted(expected.keys() | actual.keys()):
+        if name not in actual or name not in expected:
+            differences.append(f"{name}: part {'missing' if name not in actual else 'added'}")
+        elif expected[name] != actual[name]:
+            old, new = etree.fromstring(expected[name].encode()), etree.fromstring(actual[name].encode())
+            found = []
+            diff_elements(old, new, f"/{_element_name(old)}", found, limit)
+            differences.extend(f"{name} {line}" for line in found or ['differs'])
+    return differences
+
+
+def _scratch_app(work_dir):
+    # Bake into a scratch folder so that nothing of the real baked/ is read or replaced
+    app = create_app({'BAKED_FOLDER': os.path.join(work_dir, 'baked')})
+    logging.getLogger().setLevel(logging.ERROR)
+    return app
+
+
+def write_renders(corpus, output, strict):
+    """Render the corpus through this tree's render_document and store the parts under ``output``."""
+    os.makedirs(output, exist_ok=True)
+    with open(os.path.join(output, 'corpus.json'), 'w') as f:
+        json.dump(corpus, f)
+    templates = _templates()
+    for case in corpus:
+        with open(os.path.join(output, f"{case['id']}.json"), 'w') as f:
+            json.dump(render_case(rendering.render_document, case, templates, strict), f)
+    print(f"{len(corpus)} renders written to {output}")
+
+
+# Run in a worktree of the baseline revision with only its code importable: posts every
+# case to that revision's /generate and copies the document it saved to <output>/<case id>.docx
+BASELINE_DRIVER = r"""
+import json, os, shutil, sqlite3, sys
+
+corpus_path, output = sys.argv[1:]
+import app as module
+config = module.app.config
+client = module.app.test_client()
+conn = sqlite3.connect(config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):])
+stored_casings = conn.execute("SELECT id, casing FROM placeholder").fetchall()
+with open(corpus_path) as f:
+    corpus = json.load(f)
+for case in corpus:
+    conn.execute("UPDATE template SET type = ?, is_active = 1 WHERE id = ?",
+                 (case['template_type'], case['template_id']))
+    conn.executemany("UPDATE placeholder SET casing = ? WHERE id = ?",
+                     [(case['casing'] or casing, placeholder_id) for placeholder_id, casing in stored_casings])
+    conn.commit()
+    response = client.post('/generate', data=dict(case['inputs'], template_id=str(case['template_id'])))
+    doc_id = response.headers.get('Location', '').rstrip('/').rsplit('/', 1)[-1]
+    if response.status_code != 302 or not doc_id.isdigit():
+        print(f"{case['id']}: /generate answered {response.status_code}", file=sys.stderr)
+        continue
+    (file_path,) = conn.execute("SELECT file_path FROM created_document WHERE id = ?", (int(doc_id),)).fetchone()
+    shutil.copyfile(os.path.join(config['GENERATED_FOLDER'], file_path), os.path.join(output, f"{case['id']}.docx"))
+"""
+
+
+def render_baseline(revision, corpus, work_dir):
+    """Render the corpus with another revision's /generate; returns the directory of its documents."""
+    tree, output = os.path.join(work_dir, 'tree'), os.path.join(work_dir, 'baseline')
+    corpus_path = os.path.join(work_dir, 'corpus.json')
+    with open(corpus_path, 'w') as f:
+        json.dump(corpus, f)
+    os.makedirs(output)
+    subprocess.run(['git', 'worktree', 'add', '--detach', '--quiet', tree, revision], cwd=REPO_DIR, check=True)
+    try:
+        # Early revisions read only their own db/ and uploads/, later ones these settings too
+        for folder in ('db', 'uploads'):
+            os.makedirs(os.path.join(tree, folder), exist_ok=True)
+        shutil.copyfile(current_app.config['DATABASE_PATH'], os.path.join(tree, 'db', 'db.sqlite'))
+        for name in os.listdir(current_app.config['UPLOAD_FOLDER']):
+            shutil.copy2(os.path.join(current_app.config['UPLOAD_FOLDER'], name), os.path.join(tree, 'uploads'))
+        env = dict(os.environ, DATABASE_PATH=os.path.join(tree, 'db', 'db.sqlite'),
+                   UPLOAD_FOLDER=os.path.join(tree, 'uploads'), GENERATED_FOLDER=os.path.join(tree, 'generated'),
+                   BAKED_FOLDER=os.path.join(tree, 'baked'), ADMISSION_FOLDER=os.path.join(tree, 'run'),
+                   RATE_LIMIT_PER_MINUTE='0', PROFILE_SAMPLE_RATE='0', WARMUP='0', LOG_LEVEL='ERROR')
+        subprocess.run([sys.executable, '-c', BASELINE_DRIVER, corpus_path, output], cwd=tree, env=env, check=True)
+    finally:
+        subprocess.run(['git', 'worktree', 'remove', '--force', tree], cwd=REPO_DIR, check=False)
+    return output
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare MyTypist render paths on a generated input corpus.")
+    side = parser.add_mutually_exclusive_group()
+    side.add_argument('--candidate', default='original',
+                      help=f"render path to check: {', '.join(CANDIDATES)} or module:function (default: original)")
+    side.add_argument('--baseline', metavar='REV', help="check this tree against /generate of a git revision")
+    side.add_argument('--against', metavar='DIR', help="check this tree against renders stored with --write")
+    side.add_argument('--write', metavar='DIR', help="store this tree's renders and their corpus in DIR")
+    parser.add_argument('--corpus', help="read the corpus from this JSON file instead of generating it")
+    parser.add_argument('--cases', type=int, default=6, help="random input sets per template")
+    parser.add_argument('--seed', default='0', help="seed of the random input sets")
+    parser.add_argument('--strict', action='store_true', help="compare the parts without normalizing them")
+    parser.add_argument('--max-diffs', type=int, default=5, help="differing elements reported per part")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='mytypist-equivalence-') as work_dir:
+        app = _scratch_app(work_dir)
+        with app.app_context():
+            if args.against:
+                corpus_path = os.path.join(args.against, 'corpus.json')
+            else:
+                corpus_path = args.corpus
+            if corpus_path:
+                with open(corpus_path) as f:
+                    corpus = json.load(f)
+            else:
+                corpus = build_corpus(args.cases, args.seed)
+
+            if args.write:
+                write_renders(corpus, args.write, args.strict)
+                return 0
+
+            templates = _templates()
+            if args.baseline:
+                try:
+                    documents = render_baseline(args.baseline, corpus, work_dir)
+                except subprocess.CalledProcessError as e:
+                    print(f"Could not render {args.baseline}: {e}")
+                    return 2
+                label = args.baseline
+
+                def expected_for(case):
+                    path = os.path.join(documents, f"{case['id']}.docx")
+                    return document_parts(path, args.strict) if os.path.exists(path) else None
+
+                def actual_for(case):
+                    return render_case(rendering.render_document, case, templates, args.strict)
+            elif args.against:
+                label = args.against
+
+                def expected_for(case):
+                    with open(os.path.join(args.against, f"{case['id']}.json")) as f:
+                        return json.load(f)
+
+                def actual_for(case):
+                    return render_case(rendering.render_document, case, templates, args.strict)
+            else:
+                candidate = load_candidate(args.candidate)
+                label = args.candidate
+
+                def expected_for(case):
+                    return render_case(rendering.render_document, case, templates, args.strict)
+
+                def actual_for(case):
+                    return render_case(candidate, case, templates, args.strict)
+
+            mismatches = 0
+            for case in corpus:
+                expected = expected_for(case)
+                if expected is None:
+                    differences = [f"{label} did not render this case"]
+                else:
+                    differences = diff_parts(expected, actual_for(case), args.max_diffs)
+                if differences:
+                    mismatches += 1
+                    print(f"MISMATCH {case['id']}")
+                    for line in differences:
+                        print(f"    {line}")
+    print(f"{len(corpus)} renders checked against {label}, {mismatches} mismatches")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+"""
+Local load-testing harness for the HTTP routes.
+
+Starts the app under gunicorn with several worker processes, pointed at a
+seeded copy of the SQLite database and the sample templates in ``uploads/``,
+then drives a weighted mix of ``/``, ``/create/<id>``, ``/generate``,
+``/batch-generate`` and downloads at the requested concurrency.
+
+The report lists p50/p95/p99 latency, throughput and error rate per route,
+plus the SQLite lock waits observed inside the workers: commits slower than
+``--lock-threshold-ms`` and "database is locked" errors.
+
+Requires gunicorn (``pip install gunicorn``), which is not a production
+dependency.
+
+Usage:
+    python -m benchmarks.loadtest --workers 3 --concurrency 8 --duration 30
+    python -m benchmarks.loadtest --mix index=50,create=30,generate=20 --output load.json
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_PATH = os.path.join(BASE_DIR, 'db', 'db.sqlite')
+UPLOADS_DIR = os.path.join(BASE_DIR, 'uploads')
+
+DEFAULT_MIX = {'index': 30, 'create': 25, 'generate': 20, 'batch': 5, 'download': 20}
+
+# Written to the gunicorn config; runs inside each worker process
+GUNICORN_CONFIG = '''
+import os
+from benchmarks.loadtest import install_lock_probe, write_lock_stats
+
+def post_worker_init(worker):
+    install_lock_probe(float(os.environ['LOADTEST_LOCK_THRESHOLD']))
+
+def worker_exit(server, worker):
+    write_lock_stats(os.environ['LOADTEST_STATS_DIR'])
+'''
+
+_lock_stats = {'commits': 0, 'lock_waits': 0, 'lock_wait_s': 0.0, 'lock_errors': 0}
+
+
+def install_lock_probe(threshold_s):
+    """Count slow commits and "database is locked" errors in this worker."""
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+
+    import app as mytypist
+
+    local = threading.local()
+
+    @event.listens_for(Session, 'before_commit')
+    def before_commit(session):
+        local.commit_start = time.perf_counter()
+
+    @event.listens_for(Session, 'after_commit')
+    def after_commit(session):
+        start = getattr(local, 'commit_start', None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        _lock_stats['commits'] += 1
+        if elapsed > threshold_s:
+            _lock_stats['lock_waits'] += 1
+            _lock_stats['lock_wait_s'] += elapsed
+
+    with mytypist.app.app_context():
+        @event.listens_for(mytypist.db.engine, 'handle_error')
+        def handle_error(context):
+            if 'database is locked' in str(context.original_exception):
+                _lock_stats['lock_errors'] += 1
+
+
+def write_lock_stats(stats_dir):
+    """Dump this worker's lock statistics for the harness to collect."""
+    os.makedirs(stats_dir, exist_ok=True)
+    with open(os.path.join(stats_dir, f"worker_{os.getpid()}.json"), 'w') as f:
+        json.dump(_lock_stats, f)
+
+
+def seed_environment(work_dir):
+    """Copy the database and sample templates into a scratch directory."""
+    db_path = os.path.join(work_dir, 'db', 'db.sqlite')
+    os.makedirs(os.path.dirname(db_path))
+    shutil.copy(DB_PATH, db_path)
+    uploads = os.path.join(work_dir, 'uploads')
+    shutil.copytree(UPLOADS_DIR, uploads)
+    generated = os.path.join(work_dir, 'generated')
+    os.makedirs(generated)
+    os.makedirs(os.path.join(work_dir, 'baked'))
+    return db_path, uploads, generated
+
+
+def sample_input(name):
+    """Return a realistic value for a placeholder name."""
+    lowered = name.lower()
+    if 'date' in lowered:
+        return random.choice(['2024-03-02', '1999-12-31', '2001-07-14'])
+    if 'address' in lowered:
+        return '12 Ugbowo Road, Benin City, Edo State'
+    if lowered == 'name':
+        return random.choice(['Adaeze Okafor', 'Tunde Bakare', 'Ngozi Eze'])
+    return 'Sample ' + name.replace('_', ' ')
+
+
+def load_catalog(db_path, uploads):
+    """Read active templates with existing files and their placeholder names."""
+    conn = sqlite3.connect(db_path)
+    try:
+        templates = {}
+        for template_id, file_path in conn.execute(
+                "SELECT id, file_path FROM template WHERE is_active = 1"):
+            if os.path.exists(os.path.join(uploads, file_path)):
+                templates[template_id] = []
+        for template_id, name in conn.execute("SELECT template_id, name FROM placeholder"):
+            if template_id in templates and name not in templates[template_id]:
+                templates[template_id].append(name)
+    finally:
+        conn.close()
+    return templates
+
+
+def free_port():
+    """Return a free local TCP port."""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class LoadClient:
+    """Issues requests for the route mix and records the outcomes."""
+
+    def __init__(self, port, catalog, mix):
+        self.port = port
+        self.catalog = catalog
+        self.template_ids = list(catalog)
+        self.routes, self.weights = zip(*mix.items())
+        self.documents = []
+        self.lock = threading.Lock()
+        self.samples = {route: [] for route in self.routes}
+        self.errors = {route: 0 for route in self.routes}
+        self.shed = {route: 0 for route in self.routes}
+
+    def request(self, method, path, body=None):
+        """Send one request on a fresh connection."""
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=120)
+        try:
+            headers = {}
+            if body is not None:
+                body = urlencode(body)
+                headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            return response.status, response.getheader('Location')
+        finally:
+            conn.close()
+
+    def form_for(self, template_ids):
+        """Build form inputs covering every placeholder of the given templates."""
+        inputs = {}
+        for template_id in template_ids:
+            for name in self.catalog[template_id]:
+                inputs.setdefault(name, sample_input(name))
+        inputs.setdefault('name', sample_input('name'))
+        return inputs
+
+    def remember(self, location, prefix):
+        """Record a generated document id from a redirect for later downloads."""
+        if location and prefix in location:
+            with self.lock:
+                self.documents.append(int(location.rsplit('/', 1)[1]))
+
+    def issue(self, route):
+        """Issue a request for a route and return its status and Location header."""
+        if route == 'index':
+            return self.request('GET', '/')
+        if route == 'create':
+            return self.request('GET', f"/create/{random.choice(self.template_ids)}")
+        if route == 'generate':
+            template_id = random.choice(self.template_ids)
+            form = self.form_for([template_id])
+            form['template_id'] = template_id
+            status, location = self.request('POST', '/generate', form)
+            self.remember(location, '/results/')
+            return status, location
+        if route == 'batch':
+            chosen = random.sample(self.template_ids, min(3, len(self.template_ids)))
+            form = self.form_for(chosen)
+            form['template_ids'] = ','.join(str(tid) for tid in chosen)
+            return self.request('POST', '/batch-generate', form)
+        if route == 'download':
+            with self.lock:
+                document_id = random.choice(self.documents) if self.documents else None
+            if document_id is None:
+                return self.issue('generate')
+            return self.request('GET', random.choice(['/download-docx/', '/download/']) + str(document_id))
+        raise ValueError(f"Unknown route {route}")
+
+    def run_one(self):
+        """Issue one request picked from the weighted mix."""
+        route = random.choices(self.routes, self.weights)[0]
+        start = time.perf_counter()
+        shed = False
+        try:
+            status, _ = self.issue(route)
+            # 429/503 are admission control turning work away, not failures
+            shed = status in (429, 503)
+            failed = status >= 400 and not shed
+        except (OSError, http.client.HTTPException):
+            failed = True
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.samples[route].append(elapsed)
+            if failed:
+                self.errors[route] += 1
+            if shed:
+                self.shed[route] += 1
+
+
+def percentile_ms(sorted_values, pct):
+    """Return the nearest-rank percentile of sorted durations, in milliseconds."""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index] * 1000
+
+
+def summarize(client, wall_time, lock_stats):
+    """Build the report dictionary from the recorded samples."""
+    routes = {}
+    total = errors = 0
+    for route in client.routes:
+        values = sorted(client.samples[route])
+        total += len(values)
+        errors += client.errors[route]
+        routes[route] = {
+            'requests': len(values),
+            'errors': client.errors[route],
+            'error_rate': (client.errors[route] / len(values)) if values else 0.0,
+            'shed': client.shed[route],
+            'throughput_rps': len(values) / wall_time,
+            'p50_ms': percentile_ms(values, 50),
+            'p95_ms': percentile_ms(values, 95),
+            'p99_ms': percentile_ms(values, 99),
+        }
+    return {
+        'duration_s': wall_time,
+        'requests': total,
+        'errors': errors,
+        'error_rate': (errors / total) if total else 0.0,
+        'throughput_rps': total / wall_time,
+        'routes': routes,
+        'db': lock_stats,
+    }
+
+
+def print_report(report):
+    """Print the report as a table."""
+    print(f"\n{'route':<10} {'reqs':>6} {'err%':>6} {'shed':>6} {'rps':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for route, stats in report['routes'].items():
+        fmt = lambda v: f"{v:9.1f}" if v is not None else f"{'-':>9}"
+        print(f"{route:<10} {stats['requests']:>6} {stats['error_rate'] * 100:6.1f} {stats['shed']:>6} "
+              f"{stats['throughput_rps']:7.2f} {fmt(stats['p50_ms'])} {fmt(stats['p95_ms'])} "
+              f"{fmt(stats['p99_ms'])}")
+    print(f"\nTotal: {report['requests']} requests in {report['duration_s']:.1f}s "
+          f"({report['throughput_rps']:.2f} req/s), error rate {report['error_rate'] * 100:.1f}%")
+    db = report['db']
+    print(f"DB: {db['commits']} commits, {db['lock_waits']} lock waits "
+          f"({db['lock_wait_s']:.2f}s waiting), {db['lock_errors']} 'database is locked' errors")
+
+
+def parse_mix(value):
+    """Parse a ``route=weight,...`` mix specification."""
+    mix = {}
+    for item in value.split(','):
+        route, _, weight = item.partition('=')
+        if route not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"unknown route '{route}'")
+        mix[route] = float(weight)
+    return mix
+
+
+def start_server(work_dir, db_path, uploads, generated, workers, threads, port, lock_threshold, rate_limit):
+    """Start gunicorn against the seeded environment and wait until it accepts connections."""
+    config_path = os.path.join(work_dir, 'gunicorn_conf.py')
+    with open(config_path, 'w') as f:
+        f.write(GUNICORN_CONFIG)
+    env = dict(os.environ,
+               DATABASE_PATH=db_path, UPLOAD_FOLDER=uploads, GENERATED_FOLDER=generated,
+               BAKED_FOLDER=os.path.join(work_dir, 'baked'),
+               ADMISSION_FOLDER=os.path.join(work_dir, 'run'),
+               RATE_LIMIT_PER_MINUTE=str(rate_limit),
+               LOADTEST_STATS_DIR=os.path.join(work_dir, 'stats'),
+               LOADTEST_LOCK_THRESHOLD=str(lock_threshold),
+               PYTHONPATH=BASE_DIR + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    log = open(os.path.join(work_dir, 'server.log'), 'w')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--threads', str(threads),
+         '--bind', f"127.0.0.1:{port}", '--config', config_path, '--timeout', '300', 'app:app'],
+        cwd=BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited early, see {log.name}")
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("gunicorn did not start within 30 seconds")
+
+
+def collect_lock_stats(stats_dir):
+    """Sum the lock statistics written by each worker."""
+    totals = dict.fromkeys(_lock_stats, 0)
+    if os.path.isdir(stats_dir):
+        for name in os.listdir(stats_dir):
+            with open(os.path.join(stats_dir, name)) as f:
+                for key, value in json.load(f).items():
+                    totals[key] += value
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test MyTypist under a multi-worker WSGI server.")
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument('--threads', type=int, default=1, help="threads per worker")
+    parser.add_argument('--concurrency', type=int, default=4, help="concurrent client connections")
+    parser.add_argument('--duration', type=float, default=20, help="seconds to run the load")
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help="route weights, e.g. index=30,create=25,generate=20,batch=5,download=20")
+    parser.add_argument('--lock-threshold-ms', type=float, default=50,
+                        help="commits slower than this count as lock waits")
+    parser.add_argument('--rate-limit', type=int, default=0,
+                        help="per-client requests per minute on limited routes (all load comes from one "
+                             "address, so this is off by default)")
+    parser.add_argument('--output', help="write the report JSON to this path")
+    parser.add_argument('--keep', action='store_true', help="keep the scratch directory")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='mytypist-load-')
+    process = None
+    try:
+        db_path, uploads, generated = seed_environment(work_dir)
+        catalog = load_catalog(db_path, uploads)
+        if not catalog:
+            print("No active templates with files found in the seeded database")
+            return 1
+
+        port = free_port()
+        process = start_server(work_dir, db_path, uploads, generated, args.workers,
+                               args.threads, port, args.lock_threshold_ms / 1000, args.rate_limit)
+        client = LoadClient(port, catalog, args.mix)
+        print(f"Running {args.duration:.0f}s at concurrency {args.concurrency} against "
+              f"{args.workers} worker(s) on port {port}")
+
+        deadline = time.perf_counter() + args.duration
+
+        def worker_loop():
+            while time.perf_counter() < deadline:
+                client.run_one()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            for _ in range(args.concurrency):
+                pool.submit(worker_loop)
+        wall_time = time.perf_counter() - start
+
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=60)
+        report = summarize(client, wall_time, collect_lock_stats(os.path.join(work_dir, 'stats')))
+        print_report(report)
+
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+            print(f"\nReport written to {args.output}")
+        return 0
+    finally:
+        if process is not None and process.poll() is None:
+            process.kill()
+        if args.keep:
+            print(f"Scratch directory kept at {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Measure the request-thread cost of logging on the render path.
+
+fill_placeholders is run against stale placeholder rows whose paragraph
+indices no longer exist, as after a template file is replaced under existing
+rows, so every row emits one warning. The time per warning is reported for:
+
+- ``sync``: f-string warnings written by a StreamHandler in the calling
+  thread, as before logconfig was introduced
+- ``queued``: the queued handler from logconfig without rate limiting
+- ``queued+throttled``: the queued handler with the default rate limit
+- ``disabled``: the warning level switched off, as a floor
+
+Each mode writes to a scratch file, once buffered and once with an fsync per
+record to stand in for a slow sink (a congested pipe, a remote syslog or a
+disk under load).
+
+Usage:
+    python -m benchmarks.logging_overhead --warnings 20000
+"""
+
+import argparse
+import logging
+import os
+import queue
+import sys
+import tempfile
+import time
+from logging.handlers import QueueListener
+
+from docx import Document
+
+import logconfig
+import rendering
+from app import create_app
+from models import Placeholder, Template
+
+
+def legacy_fill_placeholders(doc, template, user_inputs, placeholders):
+    """The invalid-index check as it was before logconfig, formatting eagerly."""
+    paragraphs = doc.paragraphs
+    for placeholder in placeholders:
+        if not 0 <= placeholder.paragraph_index < len(paragraphs):
+            rendering.logger.warning(f"Invalid paragraph index {placeholder.paragraph_index} "
+                                     f"for placeholder {placeholder.name}")
+            continue
+
+
+class FsyncStreamHandler(logging.StreamHandler):
+    """A stream handler that waits for every record to reach the disk."""
+
+    def flush(self):
+        super().flush()
+        os.fsync(self.stream.fileno())
+
+
+def install(handler, level=logging.INFO):
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+
+def per_call_us(fill, doc, template, rows):
+    start = time.perf_counter()
+    fill(doc, template, {}, rows)
+    return (time.perf_counter() - start) / len(rows) * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure logging overhead on the render path.")
+    parser.add_argument('--warnings', type=int, default=20000, help="stale placeholder rows to process")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='mytypist-logbench-') as work_dir:
+        app = create_app({'BAKED_FOLDER': os.path.join(work_dir, 'baked')})
+        logconfig._stop_listener()
+        doc = Document()
+        doc.add_paragraph('Only paragraph')
+        template = Template(id=1, name='Log Benchmark', type='letter', file_path='logbench.docx',
+                            font_family='Times New Roman', font_size=12)
+        rows = [Placeholder(name=f'stale_{i % 20}', paragraph_index=10000 + i, start_run_index=0,
+                            end_run_index=0, bold=False, italic=False, underline=False, casing='none')
+                for i in range(args.warnings)]
+
+        results = {}
+        with app.app_context(), open(os.path.join(work_dir, 'render.log'), 'a') as log_file:
+            for sink, handler_class in (('buffered', logging.StreamHandler), ('fsync', FsyncStreamHandler)):
+                sync_handler = handler_class(log_file)
+                sync_handler.setFormatter(logging.Formatter(logconfig.LOG_FORMAT))
+                install(sync_handler)
+                results[(sink, 'sync')] = per_call_us(legacy_fill_placeholders, doc, template, rows)
+
+                for label, limit in (('queued', 0), ('queued+throttled', 5)):
+                    handler = logconfig.DeferredQueueHandler(queue.SimpleQueue(), args.warnings + 1)
+                    handler.addFilter(logconfig.ThrottleFilter(limit, 60.0))
+                    writer = handler_class(log_file)
+                    writer.setFormatter(logconfig.SuppressedCountFormatter(logconfig.LOG_FORMAT))
+                    listener = QueueListener(handler.queue, writer)
+                    listener.start()
+                    install(handler)
+                    try:
+                        results[(sink, label)] = per_call_us(rendering.fill_placeholders, doc, template, rows)
+                    finally:
+                        listener.stop()
+
+            install(logging.NullHandler(), logging.ERROR)
+            results[('-', 'disabled')] = per_call_us(rendering.fill_placeholders, doc, template, rows)
+
+    for (sink, label), cost in results.items():
+        print(f"{sink:<9} {label:<18} {cost:8.2f} us per warning in the calling thread")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Benchmark the peak memory of the generation and download routes.
+
+Synthetic templates of growing size are uploaded into a scratch app with
+memory accounting on, and each of the following requests is sent through
+the test client:
+
+- ``/generate`` of one template
+- ``/batch-generate`` of N templates
+- ``/download-all-docx`` of that batch, and ``/download-all-pdf`` when
+  LibreOffice is installed
+
+The peak and the per-stage figures are read from the ``X-Memory-Peak`` and
+``X-Memory-Stages`` headers (see memory.py). Each request is sent once to
+warm up (the first render of a template bakes it) and then ``--repeat``
+times; the highest peak is kept. Compared with a baseline, a peak that grew
+by more than ``--threshold`` fails the run.
+
+Usage:
+    python -m benchmarks.memory --output benchmarks/memory.json
+    python -m benchmarks.memory --compare benchmarks/memory.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+from docx import Document
+
+import rendering
+from app import create_app
+from models import db, Placeholder, Template
+from schema import upgrade_database
+from benchmarks.synthetic import SAMPLE_INPUTS, make_template
+
+GRIDS = {
+    'quick': {'paragraphs': [20, 100], 'batch_sizes': [2, 8]},
+    'full': {'paragraphs': [20, 100, 400], 'batch_sizes': [1, 4, 16]},
+}
+
+# Peak growth below this many KB is treated as noise when comparing
+NOISE_FLOOR_KB = 64
+
+
+def seed_templates(app, work_dir, paragraphs, count):
+    """Write ``count`` synthetic templates of one size and register them like an upload does."""
+    template_ids = []
+    with app.app_context():
+        for index in range(count):
+            file_name = f"p{paragraphs}_{index}.docx"
+            path = make_template(os.path.join(app.config['UPLOAD_FOLDER'], file_name), paragraphs, 2, 2, 0)
+            doc = Document(path)
+            font_family, font_size = rendering.detect_document_font(doc)
+            template = Template(name=f"Synthetic {paragraphs} #{index}", type='letter', file_path=file_name,
+                                font_family=font_family, font_size=font_size, version=1)
+            db.session.add(template)
+            db.session.commit()
+            for ph in rendering.extract_placeholders(doc):
+                columns = {k: v for k, v in ph.items() if k not in ('table_row', 'table_cell', 'table_paragraph')}
+                db.session.add(Placeholder(**columns, template_id=template.id))
+            db.session.commit()
+            template_ids.append(template.id)
+    return template_ids
+
+
+def parse_stages(header):
+    """Parse an X-Memory-Stages header back into a dict of stage figures."""
+    stages = {}
+    for item in filter(None, (part.strip() for part in header.split(','))):
+        name, *fields = item.split(';')
+        stages[name] = {key: float(value) for key, value in (field.split('=') for field in fields)}
+    return stages
+
+
+def measure(send, repeat):
+    """Send a request once to warm up, then ``repeat`` times; return the highest peak and its stages."""
+    send()
+    worst = None
+    for _ in range(repeat):
+        response = send()
+        if response.status_code >= 400:
+            raise RuntimeError(f"request failed with status {response.status_code}")
+        peak_kb = float(response.headers['X-Memory-Peak'].rstrip('KB'))
+        if worst is None or peak_kb > worst['peak_kb']:
+            worst = {'peak_kb': peak_kb, 'stages': parse_stages(response.headers['X-Memory-Stages'])}
+    return worst
+
+
+def run(grid, repeat):
+    """Run every route across the grid and return the results document."""
+    dims = GRIDS[grid]
+    with_pdf = shutil.which('libreoffice') is not None
+    cases = {}
+    with tempfile.TemporaryDirectory(prefix='mytypist-memory-') as work_dir:
+        app = create_app({
+            'DATABASE_PATH': os.path.join(work_dir, 'db.sqlite'),
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(work_dir, 'db.sqlite')}",
+            'UPLOAD_FOLDER': os.path.join(work_dir, 'uploads'),
+            'GENERATED_FOLDER': os.path.join(work_dir, 'generated'),
+            'BAKED_FOLDER': os.path.join(work_dir, 'baked'),
+            'ADMISSION_FOLDER': os.path.join(work_dir, 'run'),
+            'RATE_LIMIT_PER_MINUTE': 0,
+            'MEMORY_ACCOUNTING': True,
+            'SCHEMA_CHECK': False,
+        })
+        with app.app_context():
+            upgrade_database()
+        # Keep the per-request memory log lines out of the report
+        logging.getLogger().setLevel(logging.WARNING)
+        client = app.test_client()
+
+        for paragraphs in dims['paragraphs']:
+            template_ids = seed_templates(app, work_dir, paragraphs, max(dims['batch_sizes']))
+
+            def generate():
+                return client.post('/generate', data=dict(SAMPLE_INPUTS, template_id=str(template_ids[0])))
+            cases[f"p{paragraphs}_generate"] = measure(generate, repeat)
+
+            for batch_size in dims['batch_sizes']:
+                form = dict(SAMPLE_INPUTS, template_ids=','.join(map(str, template_ids[:batch_size])))
+                batch_ids = []
+
+                def batch_generate():
+                    response = client.post('/batch-generate', data=form)
+                    batch_ids.append(response.headers.get('Location', '').rsplit('/', 1)[-1])
+                    return response
+                cases[f"p{paragraphs}_batch_generate_n{batch_size}"] = measure(batch_generate, repeat)
+
+                routes = ['download-all-docx'] + (['download-all-pdf'] if with_pdf else [])
+                for route in routes:
+                    def download():
+                        return client.get(f"/{route}/{batch_ids[-1]}")
+                    cases[f"p{paragraphs}_{route.replace('-', '_')}_n{batch_size}"] = measure(download, repeat)
+
+    for cid, case in cases.items():
+        stages = '  '.join(f"{name} {stage['peak_kb']:.0f}" for name, stage in case['stages'].items())
+        print(f"{cid:<34} peak {case['peak_kb']:9.1f} KB  {stages}")
+    if not with_pdf:
+        print("LibreOffice not found: download-all-pdf skipped")
+    return {
+        'meta': {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'grid': grid,
+            'repeat': repeat,
+        },
+        'cases': cases,
+    }
+
+
+def compare(current, baseline, threshold):
+    """Compare peaks with a baseline and return the list of regressions."""
+    regressions = []
+    for cid, case in current['cases'].items():
+        base_case = baseline.get('cases', {}).get(cid)
+        if not base_case:
+            continue
+        old, new = base_case['peak_kb'], case['peak_kb']
+        change = (new - old) / old if old else 0.0
+        regressed = change > threshold and (new - old) > NOISE_FLOOR_KB
+        status = 'REGRESSION' if regressed else 'ok'
+        print(f"{cid:<34} peak_kb {old:10.1f} -> {new:10.1f} ({change:+.1%}) {status}")
+        if regressed:
+            regressions.append({'case': cid, 'baseline': old, 'current': new, 'change': change})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MyTypist peak memory per route.")
+    parser.add_argument('--grid', choices=sorted(GRIDS), default='quick', help="size grid to run")
+    parser.add_argument('--repeat', type=int, default=2, help="measured requests per case")
+    parser.add_argument('--output', help="write results JSON to this path")
+    parser.add_argument('--compare', metavar='BASELINE', help="compare against a stored baseline JSON")
+    parser.add_argument('--threshold', type=float, default=0.2, help="relative peak growth flagged as a regression")
+    args = parser.parse_args()
+
+    results = run(args.grid, args.repeat)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nComparing with {args.compare} (threshold {args.threshold:.0%})")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) found")
+            return 1
+        print("\nNo regressions found")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Benchmark the document generation hot paths.
+
+Synthetic templates are generated across a size grid and each of the
+following is timed and traced for peak memory:
+
+- ``extract_placeholders`` and ``detect_document_font`` on a loaded template
+- the full generate path (load, substitute, format, save)
+- batch generation of several templates with the same inputs
+- building the batch ZIP archive
+
+Usage:
+    python -m benchmarks.render --output benchmarks/baseline.json
+    python -m benchmarks.render --compare benchmarks/baseline.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from itertools import product
+
+from docx import Document
+
+import rendering
+from app import build_zip, create_app
+from models import Placeholder, Template
+from benchmarks.synthetic import SAMPLE_INPUTS, case_id, make_template
+
+GRIDS = {
+    'quick': {
+        'paragraphs': [20, 100],
+        'placeholders': [2],
+        'fragmentation': [1, 3],
+        'tables': [0, 2],
+    },
+    'full': {
+        'paragraphs': [20, 100, 400],
+        'placeholders': [1, 4],
+        'fragmentation': [1, 3],
+        'tables': [0, 4],
+    },
+}
+
+# Absolute changes below these floors are treated as noise when comparing
+NOISE_FLOOR = {'median_s': 0.002, 'peak_kb': 64}
+
+PLACEHOLDER_COLUMNS = ('name', 'paragraph_index', 'start_run_index', 'end_run_index',
+                       'bold', 'italic', 'underline', 'casing')
+
+
+def build_fixtures(template_path, template_id, template_type='letter'):
+    """Build the transient Template and Placeholder objects the renderer expects."""
+    doc = Document(template_path)
+    font_family, font_size = rendering.detect_document_font(doc)
+    template = Template(id=template_id, name='Synthetic Benchmark', type=template_type,
+                        file_path=os.path.basename(template_path),
+                        font_family=font_family, font_size=font_size)
+    placeholders = [Placeholder(**{col: ph[col] for col in PLACEHOLDER_COLUMNS})
+                    for ph in rendering.extract_placeholders(doc)]
+    placeholders.sort(key=lambda ph: (ph.paragraph_index, ph.start_run_index))
+    return template, placeholders
+
+
+def measure(func, repeat):
+    """Time ``func`` ``repeat`` times, then run it once more under tracemalloc."""
+    func()  # warm-up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    median = statistics.median(timings)
+    return {
+        'min_s': min(timings),
+        'median_s': median,
+        'mean_s': statistics.mean(timings),
+        'ops_per_s': (1 / median) if median else None,
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def run_case(work_dir, case_index, paragraphs, placeholders, fragmentation, tables, repeat, batch_size):
+    """Run every benchmark for one grid point."""
+    cid = case_id(paragraphs, placeholders, fragmentation, tables)
+    template_path = make_template(os.path.join(work_dir, f"{cid}.docx"),
+                                  paragraphs, placeholders, fragmentation, tables)
+    template, placeholder_rows = build_fixtures(template_path, case_index)
+    loaded = Document(template_path)
+    output_dir = os.path.join(work_dir, cid)
+    os.makedirs(output_dir, exist_ok=True)
+
+    def generate_one(index=0):
+        doc = rendering.render_document(template_path, template, SAMPLE_INPUTS, placeholder_rows)
+        out_path = os.path.join(output_dir, f"out_{index}.docx")
+        doc.save(out_path)
+        return out_path
+
+    def generate_batch():
+        return [generate_one(i) for i in range(batch_size)]
+
+    batch_files = generate_batch()
+
+    def build_batch_zip():
+        return build_zip((path, os.path.basename(path)) for path in batch_files)
+
+    results = {
+        'extract_placeholders': measure(lambda: rendering.extract_placeholders(loaded), repeat),
+        'detect_document_font': measure(lambda: rendering.detect_document_font(loaded), repeat),
+        'generate': measure(generate_one, repeat),
+        'batch_generate': measure(generate_batch, repeat),
+        'build_zip': measure(build_batch_zip, repeat),
+    }
+    for name in ('extract_placeholders', 'detect_document_font', 'generate'):
+        median = results[name]['median_s']
+        results[name]['paragraphs_per_s'] = (paragraphs / median) if median else None
+    results['batch_generate']['documents_per_s'] = (
+        batch_size / results['batch_generate']['median_s'] if results['batch_generate']['median_s'] else None)
+
+    return cid, {
+        'params': {
+            'paragraphs': paragraphs,
+            'placeholders_per_paragraph': placeholders,
+            'fragmentation': fragmentation,
+            'tables': tables,
+            'placeholder_rows': len(placeholder_rows),
+            'batch_size': batch_size,
+            'template_bytes': os.path.getsize(template_path),
+        },
+        'benchmarks': results,
+    }
+
+
+def run(grid, repeat, batch_size):
+    """Run the benchmark grid and return the results document."""
+    cases = {}
+    with tempfile.TemporaryDirectory(prefix='mytypist-bench-') as work_dir:
+        # Baked variants of the synthetic templates stay in the scratch directory
+        app = create_app({'BAKED_FOLDER': os.path.join(work_dir, 'baked')})
+        # Keep per-placeholder debug logging from dominating the timings
+        logging.getLogger().setLevel(logging.WARNING)
+        dims = GRIDS[grid]
+        grid_points = product(dims['paragraphs'], dims['placeholders'], dims['fragmentation'], dims['tables'])
+        with app.app_context():
+            for case_index, (paragraphs, placeholders, fragmentation, tables) in enumerate(grid_points, 1):
+                cid, case = run_case(work_dir, case_index, paragraphs, placeholders, fragmentation, tables,
+                                     repeat, batch_size)
+                cases[cid] = case
+                generate = case['benchmarks']['generate']
+                print(f"{cid:<22} generate {generate['median_s'] * 1000:8.2f} ms  "
+                      f"peak {generate['peak_kb']:9.1f} KB")
+    return {
+        'meta': {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'grid': grid,
+            'repeat': repeat,
+            'batch_size': batch_size,
+        },
+        'cases': cases,
+    }
+
+
+def compare(current, baseline, threshold):
+    """Compare results with a baseline and return the list of regressions."""
+    regressions = []
+    for cid, case in current['cases'].items():
+        base_case = baseline.get('cases', {}).get(cid)
+        if not base_case:
+            continue
+        for bench, metrics in case['benchmarks'].items():
+            base_metrics = base_case['benchmarks'].get(bench)
+            if not base_metrics:
+                continue
+            for metric in ('median_s', 'peak_kb'):
+                old, new = base_metrics.get(metric), metrics.get(metric)
+                if not old or new is None:
+                    continue
+                change = (new - old) / old
+                regressed = change > threshold and (new - old) > NOISE_FLOOR[metric]
+                status = 'REGRESSION' if regressed else 'ok'
+                print(f"{cid:<22} {bench:<22} {metric:<9} {old:12.4f} -> {new:12.4f} "
+                      f"({change:+.1%}) {status}")
+                if regressed:
+                    regressions.append({'case': cid, 'benchmark': bench, 'metric': metric,
+                                        'baseline': old, 'current': new, 'change': change})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MyTypist document generation.")
+    parser.add_argument('--grid', choices=sorted(GRIDS), default='quick', help="size grid to run")
+    parser.add_argument('--repeat', type=int, default=5, help="timed runs per benchmark")
+    parser.add_argument('--batch-size', type=int, default=4, help="templates per batch generation")
+    parser.add_argument('--output', help="write results JSON to this path")
+    parser.add_argument('--compare', metavar='BASELINE', help="compare against a stored baseline JSON")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="relative slowdown or memory growth flagged as a regression")
+    args = parser.parse_args()
+
+    results = run(args.grid, args.repeat, args.batch_size)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nComparing with {args.compare} (threshold {args.threshold:.0%})")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) found")
+            return 1
+        print("\nNo regressions found")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
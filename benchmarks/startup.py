@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Measure worker cold-start time.
+
+Each run starts a fresh interpreter against a scratch copy of the database and
+records how long ``import app`` takes, how long the first ``/`` request takes,
+whether python-docx and dateutil were loaded by then, and how long the first
+``/generate`` request takes once the rendering modules are pulled in.
+
+Warm-up (see warmup.py) is off unless ``--warmup`` is given; then the probe
+also records when ``/readyz`` first reports ready, and the first
+``/generate`` is sent after that.
+
+Usage:
+    python -m benchmarks.startup --runs 5
+    python -m benchmarks.startup --runs 5 --warmup
+    python -m benchmarks.startup --output benchmarks/startup.json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_PATH = os.path.join(BASE_DIR, 'db', 'db.sqlite')
+
+HEAVY_MODULES = ('docx', 'lxml.etree', 'dateutil.parser', 'rendering')
+
+# Runs in the child interpreter; prints one JSON line
+PROBE = '''
+import json, logging, sys, time
+start = time.perf_counter()
+import app as mytypist
+imported = time.perf_counter()
+logging.getLogger().setLevel(logging.WARNING)
+client = mytypist.app.test_client()
+status = client.get('/').status_code
+first_page = time.perf_counter()
+heavy = [name for name in {heavy!r} if name in sys.modules]
+result = {{'import_s': imported - start, 'first_page_s': first_page - start,
+          'index_status': status, 'heavy_after_index': heavy}}
+if {warmup!r}:
+    while client.get('/readyz').status_code != 200:
+        time.sleep(0.005)
+    result['ready_s'] = time.perf_counter() - start
+with mytypist.app.app_context():
+    template = mytypist.Template.query.filter_by(is_active=True).first()
+    names = [ph.name for ph in template.placeholders] if template else []
+if template:
+    form = {{name: 'Sample' for name in names}}
+    form['template_id'] = str(template.id)
+    begin = time.perf_counter()
+    result['generate_status'] = client.post('/generate', data=form).status_code
+    result['first_generate_s'] = time.perf_counter() - begin
+print(json.dumps(result))
+'''
+
+
+def run_once(work_dir, warmup=False):
+    """Start one cold interpreter and return its measurements."""
+    env = dict(os.environ,
+               DATABASE_PATH=os.path.join(work_dir, 'db.sqlite'),
+               UPLOAD_FOLDER=os.path.join(BASE_DIR, 'uploads'),
+               GENERATED_FOLDER=os.path.join(work_dir, 'generated'),
+               BAKED_FOLDER=os.path.join(work_dir, 'baked'),
+               WARMUP='1' if warmup else '0',
+               PYTHONPATH=BASE_DIR)
+    # Start from an unbaked state so the first render pays the full cost
+    shutil.rmtree(env['BAKED_FOLDER'], ignore_errors=True)
+    output = subprocess.run([sys.executable, '-c', PROBE.format(heavy=HEAVY_MODULES, warmup=warmup)],
+                            env=env, cwd=work_dir, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def summarize(runs, key):
+    values = [run[key] for run in runs if key in run]
+    if not values:
+        return None
+    return {'min_s': min(values), 'median_s': statistics.median(values), 'max_s': max(values)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure MyTypist worker cold-start time.")
+    parser.add_argument('--runs', type=int, default=5, help="cold starts to measure")
+    parser.add_argument('--warmup', action='store_true', help="let workers warm up and wait for /readyz")
+    parser.add_argument('--output', help="write results JSON to this path")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='mytypist-startup-') as work_dir:
+        shutil.copy(DB_PATH, os.path.join(work_dir, 'db.sqlite'))
+        runs = [run_once(work_dir, args.warmup) for _ in range(args.runs)]
+
+    results = {
+        'runs': runs,
+        'import': summarize(runs, 'import_s'),
+        'first_page': summarize(runs, 'first_page_s'),
+        'ready': summarize(runs, 'ready_s'),
+        'first_generate': summarize(runs, 'first_generate_s'),
+    }
+    for label in ('import', 'first_page', 'ready', 'first_generate'):
+        if results[label]:
+            print(f"{label:<15} median {results[label]['median_s'] * 1000:8.1f} ms  "
+                  f"(min {results[label]['min_s'] * 1000:.1f}, max {results[label]['max_s'] * 1000:.1f})")
+    heavy = sorted({name for run in runs for name in run['heavy_after_index']})
+    print(f"heavy modules loaded by /: {', '.join(heavy) or 'none'}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    # Warm-up loads them in the background on purpose
+    return 1 if heavy and not args.warmup else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
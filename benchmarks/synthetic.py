@@ -0,0 +1,85 @@
+"""
+Synthetic .docx templates for benchmarking.
+
+Templates are generated across four dimensions: number of paragraphs,
+placeholders per paragraph, run fragmentation (how many runs each
+``${placeholder}`` is split across, as Word often does) and number of tables.
+"""
+
+import os
+
+from docx import Document
+
+# Placeholder names cycle through the kinds the renderer treats differently
+PLACEHOLDER_NAMES = [
+    'name', 'department', 'date', 'address', 'faculty', 'reg_no',
+    'date_of_birth', 'session', 'religion', 'sex', 'origin', 'relationship',
+]
+
+SAMPLE_INPUTS = {
+    'name': 'Adaeze Chinwe Okafor',
+    'department': 'Computer Science',
+    'date': '2024-03-02',
+    'address': '12 Ugbowo Road, Benin City, Edo State',
+    'faculty': 'Physical Sciences',
+    'reg_no': 'PSC1904321',
+    'date_of_birth': '14/07/2003',
+    'session': '2023/2024',
+    'religion': 'Christianity',
+    'sex': 'Female',
+    'origin': 'Anambra',
+    'relationship': 'Father',
+}
+
+FILLER = "This is to certify that the undersigned has read and understood the terms "
+
+
+def _split(text, parts):
+    """Split text into at most ``parts`` non-empty chunks of similar length."""
+    parts = max(1, min(parts, len(text)))
+    size, extra = divmod(len(text), parts)
+    chunks, pos = [], 0
+    for i in range(parts):
+        step = size + (1 if i < extra else 0)
+        chunks.append(text[pos:pos + step])
+        pos += step
+    return chunks
+
+
+def _add_placeholder_runs(paragraph, name, fragmentation):
+    """Append ``${name}`` to a paragraph split across ``fragmentation`` runs."""
+    for chunk in _split('${' + name + '}', fragmentation):
+        paragraph.add_run(chunk)
+
+
+def case_id(paragraphs, placeholders, fragmentation, tables):
+    """Return the identifier of a grid point."""
+    return f"p{paragraphs}_ph{placeholders}_f{fragmentation}_t{tables}"
+
+
+def make_template(path, paragraphs, placeholders, fragmentation, tables):
+    """Write a synthetic template to ``path`` and return the path."""
+    doc = Document()
+    name_index = 0
+    for _ in range(paragraphs):
+        paragraph = doc.add_paragraph()
+        paragraph.add_run(FILLER)
+        for _ in range(placeholders):
+            _add_placeholder_runs(paragraph, PLACEHOLDER_NAMES[name_index % len(PLACEHOLDER_NAMES)],
+                                  fragmentation)
+            paragraph.add_run(" and ")
+            name_index += 1
+
+    for _ in range(tables):
+        table = doc.add_table(rows=3, cols=3)
+        for row in table.rows:
+            for cell in row.cells:
+                paragraph = cell.paragraphs[0]
+                paragraph.add_run("Field: ")
+                _add_placeholder_runs(paragraph, PLACEHOLDER_NAMES[name_index % len(PLACEHOLDER_NAMES)],
+                                      fragmentation)
+                name_index += 1
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    doc.save(path)
+    return path
@@ -0,0 +1,170 @@
+"""
+Streaming export of the generation history for audits.
+
+``/admin/export`` and ``flask --app app export-history`` write the
+``created_document`` rows (with their template's name and type) or the
+``batch_generation`` rows as CSV or NDJSON, optionally gzip-compressed as
+they are produced. Rows are read in chunks of ``CHUNK_SIZE`` by id, each
+chunk a short query of its own, so memory stays constant however long the
+history is and the export never holds a read transaction open while the
+client downloads. Rows written while an export runs may or may not be
+included.
+
+Filters: an inclusive day range on ``created_at`` and template ids. A
+batch matches a template when the template is among the batch's
+``template_ids``.
+"""
+
+import csv
+import io
+import json
+import zlib
+from datetime import timedelta
+
+import click
+from sqlalchemy import select
+
+from models import db, BatchGeneration, CreatedDocument, Template
+from search import STORED_DATETIME_FORMAT, id_bounds, parse_day
+
+CHUNK_SIZE = 1000
+
+KINDS = ('documents', 'batches')
+FORMATS = ('csv', 'ndjson')
+MIMETYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+DOCUMENT_FIELDS = ('id', 'created_at', 'user_name', 'template_id', 'template_name', 'template_type',
+                   'template_version', 'batch_id', 'file_path')
+BATCH_FIELDS = ('id', 'batch_id', 'created_at', 'completed_at', 'status', 'user_name', 'template_ids',
+                'user_inputs', 'zip_file_path')
+
+
+def _stored(value):
+    return value.strftime(STORED_DATETIME_FORMAT) if value else None
+
+
+def _document_chunks(start, end, template_ids):
+    # Ids grow with created_at, so the range also bounds the ids to read (see search.py)
+    bounds = id_bounds(_stored(start), _stored(end))
+    if bounds is None:
+        return
+    low, high = bounds
+    document, template = CreatedDocument.__table__.c, Template.__table__.c
+    # Plain rows rather than ORM objects, so nothing accumulates in the session
+    query = select(document.id, document.created_at, document.user_name, document.template_id,
+                   template.name, template.type, document.template_version, document.batch_id,
+                   document.file_path).join_from(CreatedDocument.__table__, Template.__table__)\
+        .order_by(document.id).limit(CHUNK_SIZE)
+    if high is not None:
+        query = query.where(document.id <= high)
+    if start is not None:
+        query = query.where(document.created_at >= start)
+    if end is not None:
+        query = query.where(document.created_at < end)
+    if template_ids:
+        query = query.where(document.template_id.in_(template_ids))
+    last_id = low - 1 if low is not None else None
+    while True:
+        rows = db.session.execute(query if last_id is None else query.where(document.id > last_id)).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def _batch_chunks(start, end, template_ids):
+    batch = BatchGeneration.__table__.c
+    query = select(*(batch[name] for name in BATCH_FIELDS)).order_by(batch.id).limit(CHUNK_SIZE)
+    if start is not None:
+        query = query.where(batch.created_at >= start)
+    if end is not None:
+        query = query.where(batch.created_at < end)
+    wanted = set(template_ids or ())
+    last_id = 0
+    while True:
+        rows = db.session.execute(query.where(batch.id > last_id)).all()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        if wanted:
+            rows = [row for row in rows if wanted & set(_template_ids(row.template_ids))]
+        if rows:
+            yield rows
+
+
+def _template_ids(value):
+    try:
+        return [int(template_id) for template_id in json.loads(value or '[]')]
+    except (TypeError, ValueError):
+        return []
+
+
+def _csv_chunks(fields, chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _ndjson_chunks(fields, chunks):
+    for rows in chunks:
+        yield ''.join(json.dumps(dict(zip(fields, row)), default=str) + '\n' for row in rows)
+
+
+def _gzipped(chunks):
+    # wbits=31 writes a gzip header and trailer around the deflate stream
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_history(kind='documents', fmt='csv', date_from=None, date_to=None, template_ids=None, compress=False):
+    """Yield the history as encoded bytes, chunk by chunk."""
+    start = date_from
+    end = date_to + timedelta(days=1) if date_to else None
+    if kind == 'documents':
+        fields, chunks = DOCUMENT_FIELDS, _document_chunks(start, end, template_ids)
+    else:
+        fields, chunks = BATCH_FIELDS, _batch_chunks(start, end, template_ids)
+    text_chunks = _csv_chunks(fields, chunks) if fmt == 'csv' else _ndjson_chunks(fields, chunks)
+    encoded = (chunk.encode('utf-8') for chunk in text_chunks)
+    return _gzipped(encoded) if compress else encoded
+
+
+def export_filename(kind, fmt, compress, when):
+    """Return the download name of an export, e.g. ``mytypist_documents_20240302_101500.csv.gz``."""
+    return f"mytypist_{kind}_{when:%Y%m%d_%H%M%S}.{fmt}" + ('.gz' if compress else '')
+
+
+@click.command('export-history')
+@click.option('--kind', type=click.Choice(KINDS), default='documents', show_default=True)
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), default='csv', show_default=True)
+@click.option('--from', 'date_from', help="First day to include (YYYY-MM-DD).")
+@click.option('--to', 'date_to', help="Last day to include (YYYY-MM-DD).")
+@click.option('--template-id', 'template_ids', type=int, multiple=True, help="Only this template; repeatable.")
+@click.option('--gzip', 'compress', is_flag=True, help="Compress the output with gzip.")
+@click.option('--output', type=click.Path(dir_okay=False, writable=True), help="File to write instead of stdout.")
+def export_history_command(kind, fmt, date_from, date_to, template_ids, compress, output):
+    """Write the generation history as CSV or NDJSON."""
+    try:
+        date_from = parse_day(date_from) if date_from else None
+        date_to = parse_day(date_to) if date_to else None
+    except ValueError:
+        raise click.BadParameter("dates must be YYYY-MM-DD")
+    chunks = export_history(kind, fmt, date_from, date_to, list(template_ids), compress)
+    stream = open(output, 'wb') if output else click.get_binary_stream('stdout')
+    try:
+        for chunk in chunks:
+            stream.write(chunk)
+    finally:
+        if output:
+            stream.close()
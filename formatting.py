@@ -0,0 +1,217 @@
+"""
+Text formatting and validation of placeholder values.
+
+Every placeholder has a type (text, date, address or number), detected from
+its name at upload and editable by admins. ``placeholder_formatter`` returns
+a formatter compiled once per type, template type and casing, and
+``validate_inputs`` checks the user's values against the types before any
+document is loaded.
+
+These helpers only depend on the standard library (dateutil is imported on
+first use for free-form dates), so they can be shared by the python-docx
+renderer and the HTML preview without loading python-docx.
+"""
+
+import logging
+import re
+from datetime import date
+from functools import lru_cache, partial
+
+logger = logging.getLogger(__name__)
+
+def ordinal(n):
+    """Convert a number to its ordinal form (e.g., 1 -> 1st, 2 -> 2nd)."""
+    if 11 <= (n % 100) <= 13:
+        suffix = 'th'
+    else:
+        suffix = ['th', 'st', 'nd', 'rd', 'th'][min(n % 10, 4)]
+    return str(n) + suffix
+
+# Numeric date formats parsed without dateutil: ISO / browser date input, and
+# D/M/YYYY or M/D/YYYY with "/" or "-" separators
+ISO_DATE_PATTERN = re.compile(r'([1-9]\d{3})-(\d{2})-(\d{2})')
+NUMERIC_DATE_PATTERN = re.compile(r'(\d{1,2})([/-])(\d{1,2})\2([1-9]\d{3})')
+
+def parse_date_fast(date_string):
+    """
+    Parse common numeric date formats exactly as dateutil would.
+
+    Returns None when the string is not one of those formats, so the caller
+    can fall back to dateutil. Like dateutil, an ambiguous D/M/YYYY date is
+    read month first unless the first number is greater than 12.
+    """
+    value = date_string.strip()
+    match = ISO_DATE_PATTERN.fullmatch(value)
+    if match:
+        year, month, day = (int(group) for group in match.groups())
+    else:
+        match = NUMERIC_DATE_PATTERN.fullmatch(value)
+        if not match:
+            return None
+        first, second, year = int(match.group(1)), int(match.group(3)), int(match.group(4))
+        if first > 12:
+            day, month = first, second
+        else:
+            month, day = first, second
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+def parse_date(date_string):
+    """Parse a date in any format dateutil understands; None if it is not a date."""
+    # Today's date is part of the cache key because dateutil fills missing
+    # fields (e.g. the year in "5 March") from it
+    return _parse_date_cached(date_string, date.today())
+
+@lru_cache(maxsize=2048)
+def _parse_date_cached(date_string, today):
+    date_obj = parse_date_fast(date_string)
+    if date_obj is None:
+        try:
+            from dateutil.parser import parse  # Only needed for free-form dates
+            date_obj = parse(date_string)
+        except (ValueError, OverflowError):
+            return None
+    return date_obj
+
+def format_date(date_string, template_type):
+    """Format a date string based on the template type."""
+    return _format_date_cached(date_string, template_type, date.today())
+
+@lru_cache(maxsize=2048)
+def _format_date_cached(date_string, template_type, today):
+    """Format a date string, memoized per input, template type and day."""
+    date_obj = _parse_date_cached(date_string, today)
+    if date_obj is None:
+        logger.warning("Invalid date format: %s", date_string)
+        return date_string
+    day = ordinal(date_obj.day)
+    month = date_obj.strftime("%B")
+    year = date_obj.year
+    if template_type == "letter":
+        return f"{day} {month}, {year}"
+    elif template_type == "affidavit":
+        return f"{day} of {month}, {year}"
+    return f"{date_obj.day} {month} {year}"
+
+def address_parts(address):
+    """
+    Split a comma-separated address into (line, punctuation) pairs for letters.
+
+    Lines end with a comma except the last, which ends with a full stop; a
+    line that already ends with a full stop ends the address.
+    """
+    parts = []
+    for part in (part.strip() for part in address.split(",")):
+        if part.endswith("."):
+            parts.append((part, ""))
+            break
+        parts.append((part, ","))
+    parts[-1] = (parts[-1][0], "" if parts[-1][0].endswith(".") else ".")
+    return parts
+
+# Integers or decimals, once thousands separators and spaces are removed
+NUMBER_PATTERN = re.compile(r'-?\d+(?:\.\d+)?')
+
+def _number_digits(value):
+    return value.replace(',', '').replace(' ', '')
+
+def format_number(value):
+    """Group the whole part of a number in thousands, keeping the decimals as entered."""
+    digits = _number_digits(value)
+    if not NUMBER_PATTERN.fullmatch(digits):
+        return value
+    whole, _, fraction = digits.partition('.')
+    grouped = f"{int(whole):,}"
+    if whole.startswith('-') and not grouped.startswith('-'):
+        grouped = f"-{grouped}"  # -0.5
+    return f"{grouped}.{fraction}" if fraction else grouped
+
+PLACEHOLDER_TYPES = ('text', 'date', 'address', 'number')
+
+# Name words that mark a numeric placeholder, e.g. "loan_amount"
+NUMBER_WORDS = {'amount', 'price', 'fee', 'fees', 'quantity', 'total', 'sum'}
+
+NAME_WORD_PATTERN = re.compile(r'[A-Z]?[a-z]+|[A-Z]+(?![a-z])')
+
+@lru_cache(maxsize=1024)
+def detect_placeholder_type(name):
+    """
+    Guess a placeholder's type from the words of its name, as formatting was
+    chosen before types were stored.
+
+    Whole words only, split at separators and case changes: "date_ofbirth"
+    and "dateOfBirth" are dates, "candidate_name" and "update_note" are text.
+    """
+    words = {word.lower() for word in NAME_WORD_PATTERN.findall(name)}
+    if 'date' in words:
+        return 'date'
+    if 'address' in words:
+        return 'address'
+    if NUMBER_WORDS.intersection(words):
+        return 'number'
+    return 'text'
+
+def placeholder_type(placeholder):
+    """Return a placeholder's stored type, or the detected one for rows created before types."""
+    return placeholder.value_type or detect_placeholder_type(placeholder.name)
+
+CASINGS = {'upper': str.upper, 'lower': str.lower, 'title': str.title}
+
+def _unchanged(text):
+    return text
+
+@lru_cache(maxsize=None)
+def compile_formatter(value_type, template_type, casing):
+    """
+    Return the formatter for a placeholder type, template type and casing.
+
+    Formatters take the user's value and return the text to insert, except
+    addresses in letters, whose formatter returns ``address_parts`` pairs to be
+    written on separate lines. Dates, numbers and letter addresses ignore the
+    casing rule.
+    """
+    if value_type == 'date':
+        return partial(format_date, template_type=template_type)
+    if value_type == 'number':
+        return format_number
+    if value_type == 'address' and template_type == 'letter':
+        return address_parts
+    return CASINGS.get(casing, _unchanged)
+
+def placeholder_formatter(placeholder, template_type):
+    """Return the compiled formatter of a placeholder in a template of ``template_type``."""
+    return compile_formatter(placeholder_type(placeholder), template_type, placeholder.casing)
+
+def _date_error(value):
+    return None if parse_date(value) is not None else "is not a date we can read (try 2024-03-05 or 5 March 2024)"
+
+def _number_error(value):
+    return None if NUMBER_PATTERN.fullmatch(_number_digits(value)) else "must be a number"
+
+VALIDATORS = {'date': _date_error, 'number': _number_error}
+
+def validate_inputs(placeholders, user_inputs):
+    """
+    Check the user's values against the placeholder types.
+
+    Returns ``(inputs, errors)``: the inputs with typed values stripped of
+    surrounding whitespace, and ``{placeholder name: message}`` for values that
+    cannot be formatted. Empty values are left to the form's own checks.
+    """
+    inputs = dict(user_inputs)
+    errors = {}
+    for placeholder in placeholders:
+        name = placeholder.name
+        validator = VALIDATORS.get(placeholder_type(placeholder))
+        value = inputs.get(name, "")
+        if validator is None or name in errors or not value.strip():
+            continue
+        value = value.strip()
+        error = validator(value)
+        if error:
+            errors[name] = error
+        else:
+            inputs[name] = value
+    return inputs, errors
@@ -0,0 +1,130 @@
+"""
+Logging setup for MyTypist.
+
+Records are handed to a background thread through a bounded queue, so request
+threads never format messages or write to the log stream themselves. Messages
+are formatted by the listener thread, which is why hot paths log with
+``%``-style arguments instead of f-strings.
+
+Repetitive warnings can be rate-limited by passing a ``throttle`` key (and
+usually the ``template_id``) in ``extra``; at most ``LOG_THROTTLE_LIMIT``
+records per key and template are written each ``LOG_THROTTLE_WINDOW``
+seconds, and the next record written reports how many were suppressed.
+"""
+
+import atexit
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_FORMAT = '%(levelname)s:%(name)s:%(message)s'
+
+_listener = None
+_handler = None
+
+
+class ThrottleFilter(logging.Filter):
+    """Drop records that exceed the per-key, per-template rate limit."""
+
+    def __init__(self, limit=5, window=60.0):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self._lock = threading.Lock()
+        self._buckets = {}  # (throttle key, template id) -> [window start, count, suppressed]
+
+    def filter(self, record):
+        key = getattr(record, 'throttle', None)
+        if key is None or self.limit <= 0:
+            return True
+        bucket_key = (key, getattr(record, 'template_id', None))
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(bucket_key)
+            if bucket is None or now - bucket[0] >= self.window:
+                suppressed = bucket[2] if bucket else 0
+                self._buckets[bucket_key] = [now, 1, 0]
+            elif bucket[1] < self.limit:
+                bucket[1] += 1
+                suppressed = 0
+            else:
+                bucket[2] += 1
+                return False
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Queue records without formatting them, dropping them once ``maxsize`` are pending."""
+
+    dropped = 0
+
+    def __init__(self, log_queue, maxsize):
+        super().__init__(log_queue)
+        self.maxsize = maxsize
+
+    def prepare(self, record):
+        # The listener formats the record; arguments are logged as-is
+        return record
+
+    def enqueue(self, record):
+        # SimpleQueue is unbounded but much cheaper to put to than queue.Queue
+        if self.queue.qsize() >= self.maxsize:
+            DeferredQueueHandler.dropped += 1
+            return
+        self.queue.put_nowait(record)
+
+
+class SuppressedCountFormatter(logging.Formatter):
+    """Append the number of rate-limited records to the message that follows them."""
+
+    def format(self, record):
+        message = super().format(record)
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            message += f" ({suppressed} similar messages suppressed)"
+        return message
+
+
+def _start_listener():
+    """Start the background thread that writes queued records."""
+    global _listener
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(SuppressedCountFormatter(LOG_FORMAT))
+    _listener = QueueListener(_handler.queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+
+def _stop_listener():
+    """Flush the queue and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _restart_after_fork():
+    """Threads do not survive fork(); give the child its own listener."""
+    if _handler is not None:
+        _handler.queue = queue.SimpleQueue()
+        _start_listener()
+
+
+def configure_logging(app):
+    """Install the queued root handler once per process and apply the configured level."""
+    global _handler
+    logging.getLogger().setLevel(app.config['LOG_LEVEL'])
+    if _handler is not None:
+        return
+    _handler = DeferredQueueHandler(queue.SimpleQueue(), app.config['LOG_QUEUE_SIZE'])
+    _handler.addFilter(ThrottleFilter(app.config['LOG_THROTTLE_LIMIT'], app.config['LOG_THROTTLE_WINDOW']))
+    logging.getLogger().addHandler(_handler)
+    _start_listener()
+    atexit.register(_stop_listener)
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=_restart_after_fork)
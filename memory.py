@@ -0,0 +1,117 @@
+"""
+Per-request memory accounting of the render stages.
+
+When ``MEMORY_ACCOUNTING`` is on (the default in debug mode), the generation
+and download routes run under tracemalloc. Each block wrapped in
+``memory_stage`` records how far Python allocations rose above their level
+at the start of the block (``peak_kb``) and how much of that was still held
+at its end (``retained_kb``); a stage entered several times in one request,
+like ``load`` in a batch, keeps its highest peak and the sum of what it
+retained. The response carries the stages in an ``X-Memory-Stages`` header,
+the request's own peak in ``X-Memory-Peak`` and both are logged.
+
+tracemalloc traces the whole process and slows Python code down severalfold,
+so the figures are only exact for one request at a time and the accounting
+is meant for development, not production. Memory allocated outside Python
+(LibreOffice, the C parts of lxml) is not counted.
+"""
+
+import logging
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g, has_app_context, make_response
+
+logger = logging.getLogger(__name__)
+
+_tracing_requests = 0
+_owns_tracing = False
+_lock = threading.Lock()
+
+
+def accounting_enabled():
+    """Decide whether the current request should run under tracemalloc."""
+    return current_app.debug or current_app.config.get('MEMORY_ACCOUNTING', False)
+
+
+@contextmanager
+def memory_stage(name):
+    """Record the memory used by a block when the current request is accounted."""
+    stages = g.get('memory_stages') if has_app_context() else None
+    if stages is None:
+        yield
+        return
+
+    stack = g.memory_stack
+    start, peak = tracemalloc.get_traced_memory()
+    if stack:
+        # Resetting the peak below would lose the enclosing stage's peak so far
+        stack[-1][1] = max(stack[-1][1], peak)
+    tracemalloc.reset_peak()
+    frame = [start, start]
+    stack.append(frame)
+    try:
+        yield
+    finally:
+        stack.pop()
+        end, peak = tracemalloc.get_traced_memory()
+        peak = max(frame[1], peak)
+        if stack:
+            stack[-1][1] = max(stack[-1][1], peak)
+        entry = stages.setdefault(name, {'calls': 0, 'peak_kb': 0.0, 'retained_kb': 0.0})
+        entry['calls'] += 1
+        entry['peak_kb'] = max(entry['peak_kb'], round((peak - start) / 1024, 1))
+        entry['retained_kb'] = round(entry['retained_kb'] + (end - start) / 1024, 1)
+
+
+def format_stages(stages):
+    """Format stages for the X-Memory-Stages header, e.g. ``load;peak_kb=812.4;retained_kb=640.1;calls=1``."""
+    return ', '.join(f"{name};peak_kb={entry['peak_kb']};retained_kb={entry['retained_kb']};calls={entry['calls']}"
+                     for name, entry in stages.items())
+
+
+def _start_tracing():
+    global _tracing_requests, _owns_tracing
+    with _lock:
+        if _tracing_requests == 0:
+            # Tracing started elsewhere (a benchmark, a debugger) is left running
+            _owns_tracing = not tracemalloc.is_tracing()
+            if _owns_tracing:
+                tracemalloc.start()
+        _tracing_requests += 1
+
+
+def _stop_tracing():
+    global _tracing_requests
+    with _lock:
+        _tracing_requests -= 1
+        if _tracing_requests == 0 and _owns_tracing:
+            tracemalloc.stop()
+
+
+def memory_accounted(view):
+    """Account the memory of a view's stages when accounting is enabled."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not accounting_enabled():
+            return view(*args, **kwargs)
+
+        _start_tracing()
+        g.memory_stages = {}
+        g.memory_stack = []
+        try:
+            with memory_stage('request'):
+                response = make_response(view(*args, **kwargs))
+            stages = g.memory_stages
+            total = stages.pop('request')
+        finally:
+            g.memory_stages = None
+            _stop_tracing()
+        response.headers['X-Memory-Peak'] = f"{total['peak_kb']}KB"
+        response.headers['X-Memory-Stages'] = format_stages(stages)
+        logger.info(f"Memory of {view.__name__}: peak {total['peak_kb']} KB, "
+                    f"retained {total['retained_kb']} KB; {format_stages(stages) or 'no stages'}")
+        return response
+    return wrapper
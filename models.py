@@ -0,0 +1,118 @@
+"""
+Database models for MyTypist.
+"""
+
+from datetime import datetime, timezone
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect, text
+
+db = SQLAlchemy()
+
+class Template(db.Model):
+    __tablename__ = 'template'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    type = db.Column(db.String(50), nullable=False)
+    file_path = db.Column(db.String(200), nullable=False)
+    font_family = db.Column(db.String(50), nullable=False)
+    font_size = db.Column(db.Integer, nullable=False)
+    is_active = db.Column(db.Boolean, default=True)
+    # SHA-256 of the stored file; NULL for templates uploaded before content-addressed storage
+    content_hash = db.Column(db.String(64), nullable=True)
+    original_filename = db.Column(db.String(200), nullable=True)
+    # Bumped whenever anything that affects rendered output changes
+    version = db.Column(db.Integer, nullable=False, default=1)
+    placeholders = db.relationship('Placeholder', back_populates='template', cascade="all, delete-orphan")
+    created_documents = db.relationship('CreatedDocument', back_populates='template', cascade="all, delete-orphan")
+    stats = db.relationship('TemplateStats', uselist=False, cascade="all, delete-orphan")
+
+class Placeholder(db.Model):
+    __tablename__ = 'placeholder'
+    id = db.Column(db.Integer, primary_key=True)
+    template_id = db.Column(db.Integer, db.ForeignKey('template.id'), nullable=False)
+    name = db.Column(db.String(50), nullable=False)
+    paragraph_index = db.Column(db.Integer, nullable=False)
+    start_run_index = db.Column(db.Integer, nullable=False)
+    end_run_index = db.Column(db.Integer, nullable=False)
+    bold = db.Column(db.Boolean, default=False)
+    italic = db.Column(db.Boolean, default=False)
+    underline = db.Column(db.Boolean, default=False)
+    casing = db.Column(db.String(20), default="none")
+    # text, date, address or number (see formatting.PLACEHOLDER_TYPES); NULL rows are typed by name
+    value_type = db.Column(db.String(20), nullable=True)
+    font_name = db.Column(db.String(50), nullable=True)
+    font_size = db.Column(db.Float, nullable=True)
+    template = db.relationship('Template', back_populates='placeholders')
+
+class CreatedDocument(db.Model):
+    __tablename__ = 'created_document'
+    id = db.Column(db.Integer, primary_key=True)
+    template_id = db.Column(db.Integer, db.ForeignKey('template.id'), nullable=False, index=True)
+    user_name = db.Column(db.String(100), nullable=False)
+    # Indexed for the per-day comparisons of reconcile.py
+    file_path = db.Column(db.String(200), nullable=False, index=True)
+    # Indexed for the date filters of search.py, which also expects ids to grow with it
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), index=True)
+    batch_id = db.Column(db.String(50), nullable=True)  # For batch processing
+    template_version = db.Column(db.Integer, nullable=True)
+    template = db.relationship('Template', back_populates='created_documents')
+
+class TemplateStats(db.Model):
+    """Aggregate counters per template, maintained on write (see stats.py)."""
+    __tablename__ = 'template_stats'
+    template_id = db.Column(db.Integer, db.ForeignKey('template.id'), primary_key=True)
+    document_count = db.Column(db.Integer, nullable=False, default=0)
+    render_count = db.Column(db.Integer, nullable=False, default=0)
+    render_seconds = db.Column(db.Float, nullable=False, default=0.0)
+    pdf_conversions = db.Column(db.Integer, nullable=False, default=0)
+    last_used_at = db.Column(db.DateTime, nullable=True)
+
+    @property
+    def average_render_seconds(self):
+        return self.render_seconds / self.render_count if self.render_count else None
+
+class ReconcileCheckpoint(db.Model):
+    """What the last reconcile pass saw in a storage folder (see reconcile.py)."""
+    __tablename__ = 'reconcile_checkpoint'
+    folder = db.Column(db.String(50), primary_key=True)
+    # Folder mtime before the listing, and the rows it was compared with
+    mtime_ns = db.Column(db.Integer, nullable=False)
+    max_row_id = db.Column(db.Integer, nullable=False)
+    row_count = db.Column(db.Integer, nullable=False)
+
+class BatchGeneration(db.Model):
+    __tablename__ = 'batch_generation'
+    id = db.Column(db.Integer, primary_key=True)
+    batch_id = db.Column(db.String(50), unique=True, nullable=False)
+    user_name = db.Column(db.String(100), nullable=False)
+    template_ids = db.Column(db.Text, nullable=False)  # JSON list of template IDs
+    user_inputs = db.Column(db.Text, nullable=False)  # JSON of user inputs
+    zip_file_path = db.Column(db.String(200), nullable=True)
+    status = db.Column(db.String(20), default='pending')  # pending, completed, failed
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    completed_at = db.Column(db.DateTime, nullable=True)
+
+def upgrade_schema():
+    """Create missing tables and add columns and indexes introduced since the database was created.
+
+    Returns the names of the tables that had to be created.
+    """
+    inspector = inspect(db.engine)
+    created = {table.name for table in db.metadata.sorted_tables} - set(inspector.get_table_names())
+    db.create_all()
+    inspector = inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(db.engine.dialect)}"
+                if column.default is not None and column.default.is_scalar:
+                    default = column.default.arg
+                    ddl += f" DEFAULT {int(default) if isinstance(default, bool) else repr(default)}"
+                conn.execute(text(ddl))
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+    return created
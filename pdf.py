@@ -0,0 +1,61 @@
+"""
+DOCX to PDF conversion with LibreOffice.
+
+Used by the download routes and by the worker warm-up, which converts one
+document so that LibreOffice's first start is not paid by a user.
+"""
+
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+# Scratch directories of conversions in progress, next to the target PDF; an
+# interrupted conversion leaves its directory behind for the reconcile command
+SCRATCH_PREFIX = '.pdf-'
+
+
+def converter_installed():
+    """Return True if the LibreOffice executable convert_docx_to_pdf runs is on the PATH."""
+    return shutil.which('soffice' if platform.system() == "Windows" else 'libreoffice') is not None
+
+
+def convert_docx_to_pdf(docx_path, pdf_path):
+    """Convert DOCX file to PDF using LibreOffice or similar."""
+    # LibreOffice names its output after the input; convert into a scratch
+    # directory next to the target and move the PDF into place when complete
+    out_dir = tempfile.mkdtemp(prefix=SCRATCH_PREFIX, dir=os.path.dirname(pdf_path))
+    converted_path = os.path.join(out_dir, os.path.splitext(os.path.basename(docx_path))[0] + '.pdf')
+    try:
+        if platform.system() == "Windows":
+            # Try using LibreOffice if available
+            try:
+                subprocess.run([
+                    "soffice", "--headless", "--convert-to", "pdf", 
+                    "--outdir", out_dir, docx_path
+                ], check=True, capture_output=True)
+            except (subprocess.CalledProcessError, FileNotFoundError):
+                # LibreOffice not available, try alternative method
+                logger.warning("LibreOffice not found, PDF conversion not available")
+                return False
+        else:
+            # Linux/Unix systems
+            try:
+                subprocess.run([
+                    "libreoffice", "--headless", "--convert-to", "pdf",
+                    "--outdir", out_dir, docx_path
+                ], check=True, capture_output=True)
+            except (subprocess.CalledProcessError, FileNotFoundError):
+                logger.warning("LibreOffice not found, PDF conversion not available")
+                return False
+        os.replace(converted_path, pdf_path)
+        return True
+    except Exception as e:
+        logger.error(f"PDF conversion failed: {str(e)}")
+        return False
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
@@ -0,0 +1,126 @@
+"""
+HTML live preview of a filled template.
+
+When a template version is baked, a structural snapshot of its paragraphs
+(run text, bold/italic/underline and alignment) is stored next to the baked
+document. The preview endpoint fills that snapshot with the user's inputs
+using the same text formatting as the renderer and returns HTML, without
+loading python-docx or writing to disk. When the browser names the fields
+that changed, only the paragraphs containing them are rendered again.
+"""
+
+import json
+from functools import lru_cache
+from html import escape
+
+from artifacts import preview_snapshot_path
+from formatting import placeholder_formatter
+
+# WD_ALIGN_PARAGRAPH values
+ALIGNMENTS = {0: 'left', 1: 'center', 2: 'right', 3: 'justify'}
+
+
+def build_snapshot(doc):
+    """Capture the paragraphs and runs of a python-docx document for previews."""
+    paragraphs = []
+    for paragraph in doc.paragraphs:
+        alignment = paragraph.alignment
+        paragraphs.append({
+            'align': ALIGNMENTS.get(int(alignment)) if alignment is not None else None,
+            'runs': [[run.text, bool(run.bold), bool(run.italic), bool(run.underline)] for run in paragraph.runs],
+        })
+    return {'paragraphs': paragraphs}
+
+
+@lru_cache(maxsize=64)
+def _read_snapshot(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_snapshot(template, template_file_path):
+    """Return the preview snapshot of a template version, baking the template if it has none."""
+    path = preview_snapshot_path(template, template_file_path)
+    try:
+        return _read_snapshot(path)
+    except (OSError, ValueError):
+        from rendering import bake_template  # writes the snapshot too
+        bake_template(template, template_file_path)
+        return _read_snapshot(path)
+
+
+def _styled(html, bold, italic, underline):
+    if bold:
+        html = f"<strong>{html}</strong>"
+    if italic:
+        html = f"<em>{html}</em>"
+    if underline:
+        html = f"<u>{html}</u>"
+    return html
+
+
+def _text_html(text):
+    return escape(text).replace('\n', '<br>').replace('\t', '&emsp;')
+
+
+def placeholder_html(placeholder, value, template_type, invalid=False):
+    """Format a placeholder value the way fill_placeholders does, as HTML."""
+    if not value:
+        return f'<span class="ph ph-empty">{escape(placeholder.name)}</span>'
+    if invalid:
+        # Rejected by validate_inputs; shown as typed
+        return f'<span class="ph ph-invalid">{_text_html(value)}</span>'
+    formatted = placeholder_formatter(placeholder, template_type)(value)
+    if isinstance(formatted, str):
+        html = _text_html(formatted)
+    else:
+        html = '<br>'.join(_text_html(part + punctuation) for part, punctuation in formatted)
+    html = _styled(html, placeholder.bold, placeholder.italic, placeholder.underline)
+    return f'<span class="ph">{html}</span>'
+
+
+def paragraph_html(paragraph, placeholders, user_inputs, template_type, errors=()):
+    """Render one snapshot paragraph with its placeholders (sorted by start run) filled."""
+    runs = paragraph['runs']
+    by_start = {ph.start_run_index: ph for ph in placeholders if ph.end_run_index < len(runs)}
+    parts = []
+    index = 0
+    while index < len(runs):
+        placeholder = by_start.get(index)
+        if placeholder is not None:
+            parts.append(placeholder_html(placeholder, user_inputs.get(placeholder.name, ""), template_type,
+                                          placeholder.name in errors))
+            index = placeholder.end_run_index + 1
+            continue
+        text, bold, italic, underline = runs[index]
+        parts.append(_styled(_text_html(text), bold, italic, underline))
+        index += 1
+    return ''.join(parts) or '&nbsp;'
+
+
+def render_preview(snapshot, template, placeholders, user_inputs, changed=None, errors=()):
+    """
+    Return {paragraph index: {'html', 'align'}} for a filled template.
+
+    With ``changed`` (a set of placeholder names), only paragraphs containing
+    one of those placeholders are included. Values named in ``errors`` are
+    shown unformatted.
+    """
+    paragraphs = snapshot['paragraphs']
+    by_paragraph = {}
+    for placeholder in placeholders:
+        if 0 <= placeholder.paragraph_index < len(paragraphs):
+            by_paragraph.setdefault(placeholder.paragraph_index, []).append(placeholder)
+
+    if changed is None:
+        indices = range(len(paragraphs))
+    else:
+        indices = sorted(index for index, rows in by_paragraph.items()
+                         if any(ph.name in changed for ph in rows))
+    return {
+        index: {
+            'html': paragraph_html(paragraphs[index], by_paragraph.get(index, ()), user_inputs, template.type, errors),
+            'align': paragraphs[index]['align'],
+        }
+        for index in indices
+    }
@@ -0,0 +1,192 @@
+"""
+On-demand profiling of the document generation routes.
+
+A request is profiled when it carries the admin key in its ``profile`` field
+(query string or form), or when it is picked by the configured sample rate.
+Each profile is written to the profile folder as a ``.pstats`` file, a
+flamegraph-compatible ``.collapsed`` file and a small ``.json`` summary that
+the admin dashboard reads. Only the newest ``PROFILE_KEEP`` profiles are
+kept; older ones are removed after each save.
+"""
+
+import cProfile
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import time
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import current_app, request
+
+logger = logging.getLogger(__name__)
+
+# Number of hotspots kept in the JSON summary of each profile
+TOP_HOTSPOTS = 10
+
+# The files written for each profile
+PROFILE_SUFFIXES = ('.pstats', '.collapsed', '.json')
+
+
+def should_profile():
+    """Decide whether the current request should run under the profiler."""
+    if request.values.get('profile') == current_app.config['ADMIN_KEY']:
+        return True
+    rate = current_app.config.get('PROFILE_SAMPLE_RATE', 0.0)
+    return rate > 0 and random.random() < rate
+
+
+def _request_template_key():
+    """Build a filename-safe key from the template id(s) of the current request."""
+    template_ids = request.form.getlist('template_id')
+    if not template_ids:
+        template_ids = [tid.strip() for tid in request.form.get('template_ids', '').split(',') if tid.strip()]
+    if not template_ids:
+        template_ids = request.form.getlist('template_ids[]')
+    key = '-'.join(template_ids) or 'none'
+    return re.sub(r'[^A-Za-z0-9_-]', '_', key)[:60]
+
+
+def _func_label(func):
+    """Format a pstats function tuple as ``file:line(name)``."""
+    filename, line, name = func
+    if filename == '~':
+        return name
+    return f"{os.path.basename(filename)}:{line}({name})"
+
+
+def top_hotspots(stats, limit=TOP_HOTSPOTS):
+    """Return the functions with the highest internal time from a pstats object."""
+    rows = []
+    for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+        rows.append({
+            'function': _func_label(func),
+            'calls': nc,
+            'tottime': round(tt, 6),
+            'cumtime': round(ct, 6),
+        })
+    rows.sort(key=lambda row: row['tottime'], reverse=True)
+    return rows[:limit]
+
+
+def collapsed_stacks(stats, max_depth=40, max_nodes=200000):
+    """
+    Approximate flamegraph collapsed stacks from the pstats call graph.
+
+    cProfile only records caller/callee pairs, so every root-to-leaf path is
+    expanded and the callee's internal time is attributed to each path in
+    proportion to the calls made along its last edge. The expansion is capped
+    at ``max_nodes`` visits so that dense call graphs stay cheap to dump.
+    """
+    callees = {}
+    for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+        for caller, caller_stats in callers.items():
+            callees.setdefault(caller, []).append((func, caller_stats[1]))
+    roots = [func for func, entry in stats.stats.items() if not entry[4]]
+
+    lines = {}
+    visited = [0]
+
+    def walk(func, path, share):
+        visited[0] += 1
+        tt = stats.stats[func][2]
+        path = path + [_func_label(func).replace(';', ':')]
+        own = tt * share
+        if own > 0:
+            key = ';'.join(path)
+            lines[key] = lines.get(key, 0) + own
+        if len(path) >= max_depth or visited[0] >= max_nodes:
+            return
+        for callee, calls in callees.get(func, []):
+            if _func_label(callee) in path or callee not in stats.stats:
+                continue
+            callee_calls = stats.stats[callee][1] or 1
+            walk(callee, path, share * min(1.0, calls / callee_calls))
+
+    for root in roots:
+        walk(root, [], 1.0)
+
+    # Collapsed stack counts are integers; use microseconds
+    return [f"{stack} {int(seconds * 1_000_000)}" for stack, seconds in lines.items()
+            if int(seconds * 1_000_000) > 0]
+
+
+def save_profile(profiler, folder, route, template_key, elapsed):
+    """Persist a finished profile and return its summary dictionary."""
+    os.makedirs(folder, exist_ok=True)
+    timestamp = datetime.now(timezone.utc)
+    base_name = f"{timestamp.strftime('%Y%m%d_%H%M%S_%f')}_{route}_{template_key}"
+    base_path = os.path.join(folder, base_name)
+
+    profiler.dump_stats(base_path + '.pstats')
+    stats = pstats.Stats(profiler)
+    with open(base_path + '.collapsed', 'w') as f:
+        f.write('\n'.join(collapsed_stacks(stats)))
+
+    summary = {
+        'name': base_name,
+        'route': route,
+        'template': template_key,
+        'created_at': timestamp.isoformat(),
+        'elapsed': round(elapsed, 6),
+        'total_calls': stats.total_calls,
+        'hotspots': top_hotspots(stats),
+    }
+    with open(base_path + '.json', 'w') as f:
+        json.dump(summary, f)
+    return summary
+
+
+def prune_profiles(folder, keep):
+    """Remove all but the newest ``keep`` profiles; returns the number removed."""
+    # Names start with a UTC timestamp, so they sort by age
+    names = sorted({name[:-len(suffix)] for name in os.listdir(folder)
+                    for suffix in PROFILE_SUFFIXES if name.endswith(suffix)}, reverse=True)
+    for base_name in names[keep:]:
+        for suffix in PROFILE_SUFFIXES:
+            try:
+                os.remove(os.path.join(folder, base_name + suffix))
+            except FileNotFoundError:
+                # Another worker pruned it first
+                pass
+    return max(0, len(names) - keep)
+
+
+def recent_profiles(folder, limit=20):
+    """Return the summaries of the most recent profiles, newest first."""
+    if not os.path.isdir(folder):
+        return []
+    names = sorted((n for n in os.listdir(folder) if n.endswith('.json')), reverse=True)
+    summaries = []
+    for name in names[:limit]:
+        try:
+            with open(os.path.join(folder, name)) as f:
+                summaries.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return summaries
+
+
+def profiled(view):
+    """Run a view under cProfile when the request asks for it or is sampled."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not should_profile():
+            return view(*args, **kwargs)
+
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            return profiler.runcall(view, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            try:
+                save_profile(profiler, current_app.config['PROFILE_FOLDER'],
+                             view.__name__, _request_template_key(), elapsed)
+                prune_profiles(current_app.config['PROFILE_FOLDER'], current_app.config['PROFILE_KEEP'])
+            except Exception as e:
+                logger.error(f"Failed to save profile: {str(e)}")
+    return wrapper
@@ -0,0 +1,373 @@
+"""
+Reconcile stored files with the database rows that reference them.
+
+``flask --app app reconcile`` compares each storage folder's listing with
+the rows that point into it, as sets rather than file by file:
+
+- ``uploads/``: templates whose file is missing are deleted with their
+  placeholders, documents and counters; files no template uses are removed.
+- ``generated/``: documents whose file is missing are deleted; files no
+  document references (PDFs included) are removed, in the day directories
+  of ``storage`` and in the top directory, along with the ``.pdf-*`` scratch
+  directories of interrupted PDF conversions.
+- ``baked/``: artifacts (packs, preview snapshots, thumbnails) of deleted
+  templates and superseded versions are removed.
+
+Each pass stores checkpoints of what it compared. ``uploads/`` has one: the
+folder's mtime before it was listed and the rows it was compared with. When
+the mtime is unchanged (no file added or removed) and none of those rows has
+been deleted, the next pass skips the listing and only checks rows added
+since. ``generated/`` has one per day directory (and one for its top
+directory): the directory's mtime and the count and highest id of the rows
+whose ``file_path`` lies in it. Only the days where one of them changed,
+normally today's, are listed and compared with their rows, read by
+``file_path`` prefix. ``--full`` ignores the checkpoints. Files and scratch
+directories younger than ``--min-age`` seconds are never treated as orphans,
+so uploads, renders and conversions in progress are left alone. Rows are
+deleted in transactions of at most ``--batch-size`` rows.
+"""
+
+import logging
+import os
+import re
+import shutil
+import time
+
+import click
+from flask import current_app
+from sqlalchemy import case, func
+
+from artifacts import template_cache_key
+from models import db, CreatedDocument, Placeholder, ReconcileCheckpoint, Template, TemplateStats
+from pdf import SCRATCH_PREFIX
+from stats import rebuild_stats
+from storage import day_directories
+
+logger = logging.getLogger(__name__)
+
+# template_<id>_<cache key><suffix>, see artifacts.artifact_path
+ARTIFACT_PATTERN = re.compile(r'template_(\d+)_([^.]+)(\..+)')
+ARTIFACT_SUFFIXES = ('.pack', '.preview.json', '.thumb.png')
+
+# file_path of a document in a day directory, see storage.shard_directory
+DAY_PATH_PATTERN = '____/__/__/%'
+
+
+class FolderReport:
+    """What a pass found in one folder."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.listed = None  # number of files, None when the listing was skipped
+        self.dangling = []  # ids of rows whose file is missing, None for folders without rows
+        self.orphans = []  # names of files no row references
+        self.scratch = []  # stale PDF conversion directories, generated/ only
+        self.young = 0  # orphan candidates left alone because of --min-age
+        self.directories = None  # (listed, total) for folders compared directory by directory
+
+    def summary(self):
+        line = f"{self.folder}: " + ("listing skipped" if self.listed is None else f"{self.listed} files")
+        if self.directories is not None:
+            line += " in {} of {} directories".format(*self.directories)
+        if self.dangling is not None:
+            line += f", {len(self.dangling)} rows without a file"
+        line += f", {len(self.orphans)} orphaned files"
+        if self.scratch:
+            line += f", {len(self.scratch)} stale conversion directories"
+        if self.young:
+            line += f" ({self.young} newer files kept)"
+        return line
+
+
+def _list_files(folder):
+    """Return the names of the regular files in a folder."""
+    with os.scandir(folder) as entries:
+        return {entry.name for entry in entries if entry.is_file(follow_symlinks=False)}
+
+
+def _list_files_and_scratch(folder):
+    """Return the names of the regular files in a folder and of its PDF conversion scratch directories."""
+    files, scratch = set(), []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.is_file(follow_symlinks=False):
+                files.add(entry.name)
+            elif entry.name.startswith(SCRATCH_PREFIX) and entry.is_dir(follow_symlinks=False):
+                scratch.append(entry.name)
+    return files, scratch
+
+
+def _split_by_age(folder, names, min_age):
+    """Split file or directory names into (old enough to remove, too young)."""
+    cutoff = time.time() - min_age
+    old, young = [], []
+    for name in names:
+        try:
+            mtime = os.stat(os.path.join(folder, name)).st_mtime
+        except FileNotFoundError:
+            continue
+        (old if mtime < cutoff else young).append(name)
+    return old, young
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _orphan_candidates(names, referenced, is_kept=None):
+    """Return the listed files no row references, leaving out hidden files other than temporary ones."""
+    return [name for name in names - referenced
+            if not (is_kept and is_kept(name, referenced))
+            and (not os.path.basename(name).startswith('.') or name.endswith('.tmp'))]
+
+
+def _compare(report, folder, rows_query, id_column, path_column, full):
+    """
+    Compare a folder with the rows referencing it. Returns the folder mtime
+    seen before listing and the unreferenced file names, or None instead of
+    the names when the checkpoint allowed skipping the listing.
+    """
+    checkpoint = db.session.get(ReconcileCheckpoint, report.folder)
+    mtime_ns = os.stat(folder).st_mtime_ns
+    if not full and checkpoint is not None and checkpoint.mtime_ns == mtime_ns:
+        remaining = rows_query.with_entities(func.count(id_column))\
+            .filter(id_column <= checkpoint.max_row_id).scalar()
+        if remaining == checkpoint.row_count:
+            # No file added or removed and no row deleted: only new rows can lack a file
+            new_rows = rows_query.with_entities(id_column, path_column)\
+                .filter(id_column > checkpoint.max_row_id).all()
+            report.dangling = [row_id for row_id, path in new_rows
+                               if not os.path.exists(os.path.join(folder, path))]
+            return mtime_ns, None
+
+    names = _list_files(folder)
+    report.listed = len(names)
+    rows = rows_query.with_entities(id_column, path_column).all()
+    report.dangling = [row_id for row_id, path in rows if path not in names]
+    return mtime_ns, _orphan_candidates(names, {path for _, path in rows})
+
+
+def _save_checkpoint(key, mtime_ns, max_row_id, row_count):
+    checkpoint = db.session.get(ReconcileCheckpoint, key)
+    if checkpoint is None:
+        checkpoint = ReconcileCheckpoint(folder=key)
+        db.session.add(checkpoint)
+    checkpoint.mtime_ns = mtime_ns
+    checkpoint.max_row_id = max_row_id or 0
+    checkpoint.row_count = row_count
+    db.session.commit()
+
+
+def _store_checkpoint(report, rows_query, id_column, mtime_ns):
+    max_row_id, row_count = rows_query.with_entities(func.max(id_column), func.count(id_column)).one()
+    _save_checkpoint(report.folder, mtime_ns, max_row_id, row_count)
+
+
+def _remove_files(folder, names):
+    removed = 0
+    for name in names:
+        try:
+            os.remove(os.path.join(folder, name))
+            removed += 1
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove {os.path.join(folder, name)}: {str(e)}")
+    return removed
+
+
+def _remove_directories(folder, names):
+    for name in names:
+        try:
+            shutil.rmtree(os.path.join(folder, name))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove {os.path.join(folder, name)}: {str(e)}")
+
+
+def _delete_templates(template_ids, batch_size):
+    """Delete templates and every row that depends on them, a bounded batch per transaction."""
+    for chunk in _chunks(template_ids, batch_size):
+        for model in (Placeholder, CreatedDocument, TemplateStats):
+            model.query.filter(model.template_id.in_(chunk)).delete(synchronize_session=False)
+        Template.query.filter(Template.id.in_(chunk)).delete(synchronize_session=False)
+        db.session.commit()
+
+
+def _delete_documents(document_ids, batch_size):
+    for chunk in _chunks(document_ids, batch_size):
+        CreatedDocument.query.filter(CreatedDocument.id.in_(chunk)).delete(synchronize_session=False)
+        db.session.commit()
+
+
+def _is_pdf_of_document(name, referenced):
+    """PDFs converted from a referenced document are kept (see download_pdf)."""
+    return name.endswith('.pdf') and f"{name[:-4]}.docx" in referenced
+
+
+def _reconcile_folder(report, folder, rows_query, id_column, path_column, delete_rows,
+                      full, dry_run, min_age, batch_size):
+    mtime_ns, candidates = _compare(report, folder, rows_query, id_column, path_column, full)
+    if candidates is not None:
+        report.orphans, young = _split_by_age(folder, candidates, min_age)
+        report.young = len(young)
+    if dry_run:
+        return
+    if report.dangling:
+        delete_rows(report.dangling, batch_size)
+    _remove_files(folder, report.orphans)
+    # Files kept for their age must be looked at again, so that listing is not remembered
+    if not report.young:
+        _store_checkpoint(report, rows_query, id_column, mtime_ns)
+
+
+def _document_days():
+    """Return ``{day directory: (row count, highest id)}`` of the documents, '' for those stored unsharded."""
+    path = CreatedDocument.file_path
+    day = case((path.like(DAY_PATH_PATTERN), func.substr(path, 1, 10)), else_='')
+    rows = db.session.query(day, func.count(CreatedDocument.id), func.max(CreatedDocument.id)).group_by(day)
+    return {row_day: (count, max_id) for row_day, count, max_id in rows}
+
+
+def _day_rows(day):
+    """Return (id, file_path) of the documents stored in one day directory, or unsharded for ''."""
+    path = CreatedDocument.file_path
+    # A range rather than LIKE, so that SQLite reads it from the index on file_path
+    condition = (path > f"{day}/") & (path < f"{day}0") if day else ~path.like(DAY_PATH_PATTERN)
+    return db.session.query(CreatedDocument.id, path).filter(condition).all()
+
+
+def _list_day(folder, day):
+    """
+    Return the relative paths of the files and of the PDF conversion scratch
+    directories in one day directory, or in the top directory for ''.
+    """
+    try:
+        names, scratch = _list_files_and_scratch(os.path.join(folder, day) if day else folder)
+    except FileNotFoundError:
+        return set(), []
+    if not day:
+        return names, scratch
+    return {f"{day}/{name}" for name in names}, [f"{day}/{name}" for name in scratch]
+
+
+def _day_checkpoint_key(day):
+    return f"generated/{day}" if day else 'generated'
+
+
+def _reconcile_generated(report, full, dry_run, min_age, batch_size):
+    """Compare generated/ a day directory at a time, skipping days unchanged since their checkpoint."""
+    folder = current_app.config['GENERATED_FOLDER']
+    checkpoints = {checkpoint.folder: checkpoint for checkpoint in
+                   ReconcileCheckpoint.query.filter(ReconcileCheckpoint.folder.like('generated%'))}
+    days = _document_days()
+    directories = day_directories(folder)
+    changed = []
+    for day in sorted(directories.keys() | days.keys()):
+        checkpoint = checkpoints.pop(_day_checkpoint_key(day), None)
+        row_count, max_row_id = days.get(day, (0, 0))
+        seen = (directories.get(day), row_count, max_row_id or 0)
+        if full or checkpoint is None or (checkpoint.mtime_ns, checkpoint.row_count, checkpoint.max_row_id) != seen:
+            changed.append(day)
+    report.listed = 0
+    report.directories = (len(changed), len(directories))
+
+    for day in changed:
+        # Rows before files: a document's file is written before its row, so every row read is listed
+        rows = _day_rows(day)
+        names, scratch = _list_day(folder, day)
+        report.listed += len(names)
+        dangling = [row_id for row_id, path in rows if path not in names]
+        candidates = _orphan_candidates(names, {path for _, path in rows}, is_kept=_is_pdf_of_document)
+        orphans, young = _split_by_age(folder, candidates, min_age)
+        # Scratch directories of conversions still running are left alone like young files
+        stale_scratch, running = _split_by_age(folder, scratch, min_age)
+        young += running
+        report.dangling += dangling
+        report.orphans += orphans
+        report.scratch += stale_scratch
+        report.young += len(young)
+        if dry_run:
+            continue
+        _delete_documents(dangling, batch_size)
+        _remove_files(folder, orphans)
+        _remove_directories(folder, stale_scratch)
+        # A day with files kept for their age, or without a directory, is looked at again
+        if not young and day in directories:
+            remaining = set(dangling)
+            kept = [row_id for row_id, _ in rows if row_id not in remaining]
+            _save_checkpoint(_day_checkpoint_key(day), directories[day], max(kept, default=0), len(kept))
+
+    if not dry_run and checkpoints:
+        # Days whose directory and rows are gone
+        for checkpoint in checkpoints.values():
+            db.session.delete(checkpoint)
+        db.session.commit()
+
+
+def _reconcile_baked(report, dry_run, min_age):
+    """Remove artifacts of deleted templates, superseded versions and earlier formats."""
+    folder = current_app.config['BAKED_FOLDER']
+    names = _list_files(folder)
+    report.listed = len(names)
+    current = {}
+    for template in Template.query.all():
+        template_file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], template.file_path)
+        if os.path.exists(template_file_path):
+            current[template.id] = template_cache_key(template, template_file_path)
+    candidates = []
+    for name in names:
+        match = ARTIFACT_PATTERN.fullmatch(name)
+        if name.endswith('.tmp') or match is None:
+            candidates.append(name)
+            continue
+        template_id, key, suffix = int(match.group(1)), match.group(2), match.group(3)
+        if current.get(template_id) != key or suffix not in ARTIFACT_SUFFIXES:
+            candidates.append(name)
+    report.orphans, young = _split_by_age(folder, candidates, min_age)
+    report.young = len(young)
+    if not dry_run:
+        _remove_files(folder, report.orphans)
+
+
+def reconcile(full=False, dry_run=False, min_age=3600, batch_size=500):
+    """Run one reconciliation pass and return a FolderReport per folder."""
+    config = current_app.config
+    uploads = FolderReport('uploads')
+    _reconcile_folder(uploads, config['UPLOAD_FOLDER'], Template.query, Template.id, Template.file_path,
+                      _delete_templates, full, dry_run, min_age, batch_size)
+    generated = FolderReport('generated')
+    _reconcile_generated(generated, full, dry_run, min_age, batch_size)
+    baked = FolderReport('baked')
+    baked.dangling = None
+    _reconcile_baked(baked, dry_run, min_age)
+    if not dry_run and (uploads.dangling or generated.dangling):
+        # Deleted documents change the dashboard counts
+        rebuild_stats()
+    return [uploads, generated, baked]
+
+
+@click.command('reconcile')
+@click.option('--dry-run', is_flag=True, help="Report what would be deleted without changing anything.")
+@click.option('--full', is_flag=True, help="List every folder even if its checkpoint says nothing changed.")
+@click.option('--min-age', default=3600, show_default=True,
+              help="Seconds a file must be unchanged before it can be removed as an orphan.")
+@click.option('--batch-size', default=500, show_default=True, help="Rows deleted per transaction.")
+@click.option('--verbose', is_flag=True, help="List every row and file found.")
+def reconcile_command(dry_run, full, min_age, batch_size, verbose):
+    """Remove rows whose files are missing and files no row references."""
+    start = time.perf_counter()
+    reports = reconcile(full=full, dry_run=dry_run, min_age=min_age, batch_size=batch_size)
+    for report in reports:
+        click.echo(report.summary())
+        if verbose:
+            for row_id in report.dangling or ():
+                click.echo(f"  row {row_id}: file missing")
+            for name in sorted(report.orphans):
+                click.echo(f"  {name}: not referenced")
+            for name in sorted(report.scratch):
+                click.echo(f"  {name}/: left by an interrupted PDF conversion")
+    action = "Dry run finished" if dry_run else "Reconciled"
+    click.echo(f"{action} in {time.perf_counter() - start:.2f}s")
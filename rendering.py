@@ -0,0 +1,409 @@
+"""
+Document rendering helpers built on python-docx.
+
+This module is imported lazily by the views that render or inspect templates,
+so that worker processes can serve light pages without loading python-docx
+or lxml.
+"""
+
+import io
+import logging
+import os
+import re
+from collections import namedtuple
+
+from docx import Document
+from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_LINE_SPACING
+from docx.opc.package import Unmarshaller
+from docx.opc.packuri import PackURI
+from docx.opc.part import PartFactory
+from docx.opc.pkgreader import PackageReader
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+from docx.package import Package
+from docx.shared import Inches, Pt, RGBColor
+from docx.text.parfmt import ParagraphFormat
+from flask import current_app
+
+from artifacts import (preview_snapshot_path, remove_baked_templates, template_cache_key,
+                       template_pack_path, write_json_atomic)
+from formatting import detect_placeholder_type, placeholder_formatter
+from memory import memory_stage
+from models import Placeholder
+from preview import build_snapshot
+from sharedcache import forget_pack, open_pack, write_pack
+
+logger = logging.getLogger(__name__)
+
+def extract_placeholders(doc):
+    """Extract placeholders like ${name} from a Word document with enhanced robustness."""
+    placeholders = []
+    placeholder_pattern = re.compile(r'\$\{([^}]+)\}')
+    
+    # Process paragraphs
+    for p_idx, paragraph in enumerate(doc.paragraphs):
+        full_text = ''.join(run.text for run in paragraph.runs)
+        matches = placeholder_pattern.finditer(full_text)
+        for match in matches:
+            placeholder_name = match.group(1).strip()
+            start_pos = match.start()
+            end_pos = match.end()
+            current_pos = 0
+            start_run_idx = end_run_idx = None
+            bold = italic = underline = False
+            font_name = None
+            font_size = None
+            
+            for r_idx, run in enumerate(paragraph.runs):
+                run_start = current_pos
+                run_end = current_pos + len(run.text)
+                if start_run_idx is None and run_start <= start_pos < run_end:
+                    start_run_idx = r_idx
+                    bold = run.font.bold or False
+                    italic = run.font.italic or False
+                    underline = run.font.underline or False
+                    font_name = run.font.name
+                    font_size = run.font.size.pt if run.font.size else None
+                if run_start < end_pos <= run_end:
+                    end_run_idx = r_idx
+                    break
+                current_pos = run_end
+                
+            if start_run_idx is not None and end_run_idx is not None:
+                placeholders.append({
+                    'paragraph_index': p_idx,
+                    'start_run_index': start_run_idx,
+                    'end_run_index': end_run_idx,
+                    'name': placeholder_name,
+                    'bold': bold,
+                    'italic': italic,
+                    'underline': underline,
+                    'casing': 'none',
+                    'value_type': detect_placeholder_type(placeholder_name),
+                    'font_name': font_name,
+                    'font_size': font_size
+                })
+    
+    # Process tables
+    for table in doc.tables:
+        for row_idx, row in enumerate(table.rows):
+            for cell_idx, cell in enumerate(row.cells):
+                for p_idx, paragraph in enumerate(cell.paragraphs):
+                    full_text = ''.join(run.text for run in paragraph.runs)
+                    matches = placeholder_pattern.finditer(full_text)
+                    for match in matches:
+                        placeholder_name = match.group(1).strip()
+                        placeholders.append({
+                            'paragraph_index': -1,  # Special marker for table cells
+                            'table_row': row_idx,
+                            'table_cell': cell_idx,
+                            'table_paragraph': p_idx,
+                            'start_run_index': 0,
+                            'end_run_index': 0,
+                            'name': placeholder_name,
+                            'bold': False,
+                            'italic': False,
+                            'underline': False,
+                            'casing': 'none',
+                            'value_type': detect_placeholder_type(placeholder_name),
+                            'font_name': None,
+                            'font_size': None
+                        })
+    
+    return placeholders
+
+def detect_document_font(doc):
+    """Detect the most common font and size in a document."""
+    font_counts = {}
+    for para in doc.paragraphs:
+        for run in para.runs:
+            if run.font.name and run.font.size:
+                key = (run.font.name, int(run.font.size.pt))
+                font_counts[key] = font_counts.get(key, 0) + 1
+    if font_counts:
+        return max(font_counts.items(), key=lambda x: x[1])[0]
+    return "Times New Roman", 12
+
+def set_default_font(doc, font_name, font_size):
+    """Set the default font for a document."""
+    style = doc.styles['Normal']
+    font = style.font
+    font.name = font_name
+    font.size = Pt(font_size)
+
+def enhance_normal_style(doc):
+    """Give the Normal style a default font, paragraph spacing and single line spacing."""
+    try:
+        normal_style = doc.styles['Normal']
+        normal_font = normal_style.font
+        if not normal_font.name:
+            normal_font.name = 'Times New Roman'
+        if not normal_font.size:
+            normal_font.size = Pt(12)
+        
+        # Set paragraph formatting
+        normal_paragraph_format = normal_style.paragraph_format
+        normal_paragraph_format.space_after = Pt(6)
+        normal_paragraph_format.line_spacing_rule = WD_LINE_SPACING.SINGLE
+    except KeyError:
+        pass  # Style doesn't exist
+
+def set_page_margins(section):
+    """Set one-inch margins on a section."""
+    section.top_margin = Inches(1)
+    section.bottom_margin = Inches(1)
+    section.left_margin = Inches(1)
+    section.right_margin = Inches(1)
+
+def add_page_number(section):
+    """Add a centred PAGE field to a section's footer."""
+    footer = section.footer
+    paragraph = footer.paragraphs[0] if footer.paragraphs else footer.add_paragraph()
+    paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    
+    run = paragraph.add_run()
+    fldChar1 = OxmlElement('w:fldChar')
+    fldChar1.set(qn('w:fldCharType'), 'begin')
+    
+    instrText = OxmlElement('w:instrText')
+    instrText.set(qn('xml:space'), 'preserve')
+    instrText.text = "PAGE"
+    
+    fldChar2 = OxmlElement('w:fldChar')
+    fldChar2.set(qn('w:fldCharType'), 'end')
+    
+    run._r.append(fldChar1)
+    run._r.append(instrText)
+    run._r.append(fldChar2)
+    
+    # Add styling to page numbers
+    run.font.size = Pt(9)
+    run.font.name = "Arial"
+    run.font.color.rgb = RGBColor(128, 128, 128)
+
+# Lower-cased paragraph markers used by the alignment rules
+LETTER_DATE_MARKERS = ("date:", "dated:")
+LETTER_SIGNATURE_MARKERS = ("sincerely", "regards", "yours", "faithfully")
+AFFIDAVIT_TITLE_MARKERS = ("affidavit", "declaration")
+
+def bake_document(doc, font_family, font_size):
+    """
+    Apply every formatting step that does not depend on user input.
+
+    Sets the default font, fixes the Normal style, gives paragraphs and runs
+    their spacing and font defaults, and sets margins and page-number footers.
+    A baked template only needs fill_placeholders and finish_document to
+    produce the same document as the original post-processing passes applied
+    after substitution (kept in benchmarks/equivalence.py as the reference).
+    """
+    set_default_font(doc, font_family, font_size)
+    enhance_normal_style(doc)
+    default_size = Pt(12)
+
+    for p in doc.element.body.p_lst:
+        paragraph_format = ParagraphFormat(p)
+        if paragraph_format.space_after is None:
+            paragraph_format.space_after = Pt(6)
+        if paragraph_format.line_spacing_rule is None:
+            paragraph_format.line_spacing_rule = WD_LINE_SPACING.SINGLE
+
+        for r in p.r_lst:
+            rPr = r.get_or_add_rPr()
+            if rPr.rFonts_ascii is None:
+                rPr.rFonts_ascii = 'Times New Roman'
+                rPr.rFonts_hAnsi = 'Times New Roman'
+            if rPr.sz_val is None:
+                rPr.sz_val = default_size
+
+    for section in doc.sections:
+        set_page_margins(section)
+        add_page_number(section)
+
+    return doc
+
+def finish_document(doc, template_type=None):
+    """
+    Apply the input-dependent cleanup and formatting to a filled, baked document.
+
+    Walks the body paragraphs once, removes runs emptied by substitution and
+    applies the spacing and alignment rules that depend on the paragraph text,
+    which is built and lower-cased once per paragraph.
+    """
+    w_r, w_t, w_val = qn('w:r'), qn('w:t'), qn('w:val')
+
+    for p in doc.element.body.p_lst:
+        # Drop runs whose first text element was emptied by substitution
+        for r in list(p.iter(w_r)):
+            t = next(r.iter(w_t), None)
+            if t is not None and t.text == '':
+                r.getparent().remove(r)
+
+        runs = p.r_lst
+        text = ''.join(r.text for r in runs)
+        if not text.strip():
+            continue
+
+        paragraph_format = ParagraphFormat(p)
+        paragraph_format.space_before = Pt(6)
+        paragraph_format.space_after = Pt(6)
+        paragraph_format.line_spacing = 1.15
+
+        lowered = text.lower()
+        if template_type == "letter":
+            if any(marker in lowered for marker in LETTER_DATE_MARKERS):
+                paragraph_format.alignment = WD_ALIGN_PARAGRAPH.RIGHT
+            elif any(marker in lowered for marker in LETTER_SIGNATURE_MARKERS):
+                paragraph_format.alignment = WD_ALIGN_PARAGRAPH.RIGHT
+        elif template_type == "affidavit":
+            if any(marker in lowered for marker in AFFIDAVIT_TITLE_MARKERS):
+                paragraph_format.alignment = WD_ALIGN_PARAGRAPH.CENTER
+                for r in runs:
+                    b = r.get_or_add_rPr().b
+                    # <w:b/> is already bold; anything else gets rewritten
+                    if b is None or b.get(w_val) is not None:
+                        r.rPr._set_bool_val('b', True)
+
+        if len(text) < 50 and text.isupper():
+            # Likely a heading
+            paragraph_format.alignment = WD_ALIGN_PARAGRAPH.CENTER
+            paragraph_format.space_before = Pt(12)
+            paragraph_format.space_after = Pt(12)
+
+    return doc
+
+_PackedRelationship = namedtuple('_PackedRelationship',
+                                 'rId reltype target_ref is_external target_partname')
+
+class _PackReader:
+    """The part of python-docx's PackageReader interface that Unmarshaller uses, over a pack."""
+
+    def __init__(self, pack):
+        self._pack = pack
+
+    def iter_sparts(self):
+        for (partname, content_type, reltype), (offset, length) in zip(self._pack.index['parts'],
+                                                                        self._pack.index['blobs']):
+            yield PackURI(partname), content_type, reltype, self._pack.blob(offset, length)
+
+    def iter_srels(self):
+        for source_uri, rId, reltype, target_ref, is_external, target_partname in self._pack.index['rels']:
+            target = PackURI(target_partname) if target_partname else None
+            yield source_uri, _PackedRelationship(rId, reltype, target_ref, is_external, target)
+
+def pack_document(doc):
+    """Serialize a document into a pack index and its part blobs, as Document() would read it."""
+    stream = io.BytesIO()
+    doc.save(stream)
+    reader = PackageReader.from_file(stream)
+    parts, blobs = [], []
+    for partname, content_type, reltype, blob in reader.iter_sparts():
+        parts.append((partname, content_type, reltype))
+        blobs.append(blob)
+    rels = [(source_uri, srel.rId, srel.reltype, srel.target_ref, srel.is_external,
+             None if srel.is_external else srel.target_partname)
+            for source_uri, srel in reader.iter_srels()]
+    return {'parts': parts, 'rels': rels}, blobs
+
+def document_from_pack(pack):
+    """Build a python-docx document from a pack without opening a zip file."""
+    package = Package()
+    Unmarshaller.unmarshal(_PackReader(pack), package, PartFactory)
+    return package.main_document_part.document
+
+def bake_template(template, template_file_path=None):
+    """Write the render-ready variant of a template to disk and return the baked document."""
+    if template_file_path is None:
+        template_file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], template.file_path)
+    doc = bake_document(Document(template_file_path), template.font_family, template.font_size)
+    index, blobs = pack_document(doc)
+    write_pack(template_pack_path(template, template_file_path), index, blobs)
+    write_json_atomic(preview_snapshot_path(template, template_file_path), build_snapshot(doc))
+    remove_baked_templates(template.id, keep_key=template_cache_key(template, template_file_path))
+    return doc
+
+def load_baked_template(template, template_file_path):
+    """Load the baked variant of a template version from its shared pack, baking it first if it is missing."""
+    pack_path = template_pack_path(template, template_file_path)
+    try:
+        return document_from_pack(open_pack(pack_path, family=template.id))
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        # Unreadable or written by an older release; bake it again
+        forget_pack(pack_path)
+        logger.warning(f"Could not read template pack {pack_path}: {str(e)}")
+    try:
+        return bake_template(template, template_file_path)
+    except OSError as e:
+        logger.warning(f"Could not store baked template for {template.name}: {str(e)}")
+        return bake_document(Document(template_file_path), template.font_family, template.font_size)
+
+def render_document(template_file_path, template, user_inputs, placeholders=None):
+    """Load a template, substitute the user's inputs and apply the final formatting."""
+    with memory_stage('load'):
+        doc = load_baked_template(template, template_file_path)
+    if placeholders is None:
+        placeholders = Placeholder.query.filter_by(template_id=template.id)\
+            .order_by(Placeholder.paragraph_index, Placeholder.start_run_index).all()
+
+    with memory_stage('fill'):
+        fill_placeholders(doc, template, user_inputs, placeholders)
+    with memory_stage('finish'):
+        finish_document(doc, template.type)
+    return doc
+
+def fill_placeholders(doc, template, user_inputs, placeholders):
+    """Substitute formatted user inputs into the runs recorded for each placeholder."""
+    paragraphs = doc.paragraphs
+    debug = logger.isEnabledFor(logging.DEBUG)
+    for placeholder in placeholders:
+        if placeholder.paragraph_index == -1:
+            # Table cell placeholders are not substituted yet
+            continue
+        if not 0 <= placeholder.paragraph_index < len(paragraphs):
+            logger.warning("Invalid paragraph index %s for placeholder %s", placeholder.paragraph_index,
+                           placeholder.name, extra={'throttle': 'invalid-paragraph', 'template_id': template.id})
+            continue
+        paragraph = paragraphs[placeholder.paragraph_index]
+        if placeholder.start_run_index >= len(paragraph.runs) or placeholder.end_run_index >= len(paragraph.runs):
+            logger.warning("Invalid run indices for placeholder %s in paragraph %s", placeholder.name,
+                           placeholder.paragraph_index, extra={'throttle': 'invalid-runs', 'template_id': template.id})
+            continue
+
+        formatted = placeholder_formatter(placeholder, template.type)(user_inputs.get(placeholder.name, ""))
+        if not isinstance(formatted, str):
+            # Address lines for letters
+            if placeholder.start_run_index != placeholder.end_run_index:
+                for r_idx in range(placeholder.start_run_index + 1, placeholder.end_run_index + 1):
+                    paragraph.runs[r_idx].text = ""
+            run = paragraph.runs[placeholder.start_run_index]
+            run.clear()
+            for i, (part, punctuation) in enumerate(formatted):
+                run.add_text(part)
+                if punctuation:
+                    run.add_text(punctuation)
+                if i < len(formatted) - 1:
+                    run.add_break()
+            run.font.name = template.font_family
+            run.font.size = Pt(template.font_size)
+            run.bold = placeholder.bold
+            run.italic = placeholder.italic
+            run.underline = placeholder.underline
+            continue
+
+        run = paragraph.runs[placeholder.start_run_index]
+        if placeholder.start_run_index == placeholder.end_run_index:
+            run.text = formatted
+        else:
+            if debug:
+                logger.debug("Placeholder %s spans multiple runs (%s to %s)", placeholder.name,
+                             placeholder.start_run_index, placeholder.end_run_index,
+                             extra={'throttle': 'multi-run', 'template_id': template.id})
+            for r_idx in range(placeholder.start_run_index + 1, placeholder.end_run_index + 1):
+                paragraph.runs[r_idx].text = ""
+            run.text = formatted
+        run.font.name = template.font_family
+        run.font.size = Pt(template.font_size)
+        run.bold = placeholder.bold
+        run.italic = placeholder.italic
+        run.underline = placeholder.underline
@@ -0,0 +1,49 @@
+"""
+Version of the database schema.
+
+Tables, columns, the dashboard counters and the search index are created
+and upgraded by ``python update_db.py``, run once per deployment, never by
+the workers: several workers booting at once would race on the same SQLite
+file. The upgrade stamps SQLite's ``user_version`` with ``SCHEMA_VERSION``
+and ``create_app`` refuses to start on a database stamped with an older
+version. Raise ``SCHEMA_VERSION`` whenever a model gains a table or column
+or the search index changes.
+"""
+
+from sqlalchemy import text
+
+from models import db, upgrade_schema
+from search import install_search_index
+from stats import rebuild_stats
+
+SCHEMA_VERSION = 2
+
+
+class SchemaOutdated(RuntimeError):
+    """The database was not upgraded for this version of the code."""
+
+
+def schema_version():
+    """Return the version the database was last upgraded to, 0 if never."""
+    with db.engine.connect() as conn:
+        return conn.execute(text("PRAGMA user_version")).scalar()
+
+
+def check_schema():
+    """Raise SchemaOutdated if the database is behind the code."""
+    version = schema_version()
+    if version < SCHEMA_VERSION:
+        raise SchemaOutdated(f"Database schema is at version {version}, this code needs {SCHEMA_VERSION}: "
+                             f"run python update_db.py")
+
+
+def upgrade_database():
+    """Create and upgrade the tables, counters and search index, then stamp the version."""
+    created_tables = upgrade_schema()
+    if 'template_stats' in created_tables:
+        rebuild_stats()
+    install_search_index()
+    with db.engine.begin() as conn:
+        # PRAGMA takes no bound parameters; the version is our own integer
+        conn.execute(text(f"PRAGMA user_version = {int(SCHEMA_VERSION)}"))
+    return created_tables
@@ -0,0 +1,207 @@
+"""
+Full-text search over the generation history.
+
+``document_search`` is an SQLite FTS5 table with one row per
+``created_document`` row (same rowid) holding the user name, template name,
+template type and batch id. Triggers keep it in step with every insert,
+update and delete of a document, including the bulk deletes of reconcile,
+and with renames of templates, so no application code writes to it.
+``flask --app app rebuild-search-index`` fills it again from scratch.
+
+Each word of a query must match the start of a word in one of the columns,
+so "ada oka" finds "Adaeze_Okafor" and the first characters of a batch id
+find its batch. Results come newest first, a page at a
+time, with the id of the last row as the cursor of the next page. FTS5
+walks its rowids in descending order and stops after a page. A date range
+becomes a rowid range through the index on ``created_at``, because ids
+grow with creation time. Neither needs a scan of ``created_document``.
+"""
+
+import logging
+import re
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from models import db
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Prefixes up to this length have their own index, so even "a" or "letter"
+# on a million rows reads one page of matches instead of merging every token
+# that starts with it. Longer prefixes are still matched, by that merge.
+MAX_INDEXED_PREFIX = 12
+
+# Words as the index splits them: letters and digits, with hyphens kept
+# inside words so that a batch id is a single word
+WORD_PATTERN = re.compile(r'[^\W_]+(?:-[^\W_]+)*')
+
+# created_at as SQLAlchemy stores it in SQLite
+STORED_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+# The indexed columns of the document a trigger fired for
+_NEW_ROW = """
+    INSERT INTO document_search (rowid, user_name, template_name, template_type, batch_id)
+    SELECT new.id, new.user_name, template.name, template.type, new.batch_id
+    FROM template WHERE template.id = new.template_id;
+"""
+
+SEARCH_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS document_search USING fts5(
+        user_name, template_name, template_type, batch_id, detail = column,
+        tokenize = "unicode61 remove_diacritics 2 tokenchars '-'",
+        prefix = '{' '.join(str(length) for length in range(1, MAX_INDEXED_PREFIX + 1))}')""",
+    "CREATE INDEX IF NOT EXISTS ix_created_document_created_at ON created_document (created_at)",
+    "CREATE INDEX IF NOT EXISTS ix_created_document_template_id ON created_document (template_id)",
+    f"CREATE TRIGGER IF NOT EXISTS document_search_insert AFTER INSERT ON created_document BEGIN {_NEW_ROW} END",
+    "CREATE TRIGGER IF NOT EXISTS document_search_delete AFTER DELETE ON created_document BEGIN "
+    "DELETE FROM document_search WHERE rowid = old.id; END",
+    f"""CREATE TRIGGER IF NOT EXISTS document_search_update
+        AFTER UPDATE OF user_name, template_id, batch_id ON created_document BEGIN
+        DELETE FROM document_search WHERE rowid = old.id;
+        {_NEW_ROW}
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS document_search_template_update AFTER UPDATE OF name, type ON template
+        WHEN old.name IS NOT new.name OR old.type IS NOT new.type BEGIN
+        UPDATE document_search SET template_name = new.name, template_type = new.type
+        WHERE rowid IN (SELECT id FROM created_document WHERE template_id = new.id);
+    END""",
+]
+
+_FILL_SQL = """
+    INSERT INTO document_search (rowid, user_name, template_name, template_type, batch_id)
+    SELECT created_document.id, created_document.user_name, template.name, template.type, created_document.batch_id
+    FROM created_document JOIN template ON template.id = created_document.template_id
+"""
+
+_COLUMNS = """created_document.id, created_document.user_name, created_document.file_path,
+    created_document.created_at, created_document.batch_id, template.name, template.type"""
+
+
+class SearchUnavailable(Exception):
+    """The SQLite library has no FTS5 or the index was never created."""
+
+
+def install_search_index():
+    """Create the search table, its triggers and indexes if missing; returns True if the table is new."""
+    with db.engine.begin() as conn:
+        exists = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'document_search'")).first()
+        try:
+            for ddl in SEARCH_DDL:
+                conn.execute(text(ddl))
+        except OperationalError as e:
+            # Without FTS5 the rest of the app still works; /search reports it
+            logger.warning(f"Could not create the search index: {str(e)}")
+            return False
+        if not exists:
+            conn.execute(text(_FILL_SQL))
+    return not exists
+
+
+def rebuild_search_index():
+    """Empty the search table and fill it from created_document; returns the number of rows indexed."""
+    install_search_index()
+    with db.engine.begin() as conn:
+        conn.execute(text("DELETE FROM document_search"))
+        conn.execute(text(_FILL_SQL))
+        return conn.execute(text("SELECT count(*) FROM document_search")).scalar()
+
+
+def match_expression(query):
+    """Turn a user's query into an FTS5 expression of quoted prefix terms, or None if it has no words."""
+    # One prefix term per word: the index keeps no positions, so it cannot match phrases
+    terms = WORD_PATTERN.findall(query)
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def parse_day(value):
+    """Parse a YYYY-MM-DD date filter; raises ValueError."""
+    return datetime.strptime(value, '%Y-%m-%d')
+
+
+def stored_bounds(date_from, date_to):
+    """Return inclusive day filters as [start, end) created_at values, each None when not given."""
+    start = date_from.strftime(STORED_DATETIME_FORMAT) if date_from else None
+    end = (date_to + timedelta(days=1)).strftime(STORED_DATETIME_FORMAT) if date_to else None
+    return start, end
+
+
+def id_bounds(start, end):
+    """Return the (lowest, highest) document ids created in [start, end), or None when no row was."""
+    low = high = None
+    if start is not None:
+        low = db.session.execute(text(
+            "SELECT id FROM created_document WHERE created_at >= :start ORDER BY created_at LIMIT 1"),
+            {'start': start}).scalar()
+        if low is None:
+            return None
+    if end is not None:
+        high = db.session.execute(text(
+            "SELECT id FROM created_document WHERE created_at < :end ORDER BY created_at DESC LIMIT 1"),
+            {'end': end}).scalar()
+        if high is None:
+            return None
+    return low, high
+
+
+def search_documents(query='', date_from=None, date_to=None, before=None, limit=PAGE_SIZE):
+    """
+    Return (rows, next cursor) for documents matching ``query`` created
+    between ``date_from`` and ``date_to`` (inclusive days), newest first and
+    with ids below ``before``. Rows are dicts; the cursor is None on the last page.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    start, end = stored_bounds(date_from, date_to)
+    bounds = id_bounds(start, end)
+    if bounds is None:
+        return [], None
+
+    params = {'limit': limit, 'before': before, 'low': bounds[0], 'high': bounds[1], 'start': start, 'end': end}
+    conditions = []
+    match = match_expression(query or '')
+    id_column = 'document_search.rowid' if match else 'created_document.id'
+    if match:
+        conditions.append("document_search MATCH :match")
+        params['match'] = match
+    for value, condition in ((before, f"{id_column} < :before"), (bounds[0], f"{id_column} >= :low"),
+                             (bounds[1], f"{id_column} <= :high"),
+                             # The unary + keeps SQLite from walking the created_at index instead
+                             (start, "+created_document.created_at >= :start"),
+                             (end, "+created_document.created_at < :end")):
+        if value is not None:
+            conditions.append(condition)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    if match:
+        sql = f"""SELECT {_COLUMNS} FROM document_search
+            JOIN created_document ON created_document.id = document_search.rowid
+            JOIN template ON template.id = created_document.template_id
+            {where} ORDER BY document_search.rowid DESC LIMIT :limit"""
+    else:
+        sql = f"""SELECT {_COLUMNS} FROM created_document
+            JOIN template ON template.id = created_document.template_id
+            {where} ORDER BY created_document.id DESC LIMIT :limit"""
+
+    try:
+        result = db.session.execute(text(sql), params).all()
+    except OperationalError as e:
+        if 'document_search' in str(e):
+            raise SearchUnavailable(str(e)) from e
+        raise
+    rows = [{'id': row[0], 'user_name': row[1], 'file_path': row[2], 'created_at': row[3],
+             'batch_id': row[4], 'template_name': row[5], 'template_type': row[6]} for row in result]
+    return rows, (rows[-1]['id'] if len(rows) == limit else None)
+
+
+@click.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Rebuild the full-text index of the generation history."""
+    indexed = rebuild_search_index()
+    click.echo(f"Indexed {indexed} documents")
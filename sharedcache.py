@@ -0,0 +1,123 @@
+"""
+Host-wide cache of baked template packs.
+
+A pack holds everything needed to rebuild a baked template without opening
+its zip file: the inflated bytes of every part plus the content types and
+relationship graph, resolved once at bake time. Packs are files in
+``BAKED_FOLDER`` named like the other template artifacts, so an admin update
+(which bumps the template version) gives the template a new pack name and
+every worker picks it up on its next render.
+
+Each worker maps a pack read-only with ``mmap``; the pages live in the page
+cache and are shared by every process on the host instead of being read and
+inflated again by each worker. Blobs are handed out as ``memoryview`` slices
+of the map, not copies: binary parts (images, embedded fonts) stay in the
+shared pages for the life of a render, and XML parts are parsed straight
+from them into the worker's own lxml trees. A worker keeps at most ``MAX_OPEN_PACKS`` maps
+open and drops its map of an older version as soon as it opens a newer one; a
+dropped map is unmapped once no render in progress still holds it. This module
+has no python-docx dependency.
+
+Layout: ``MAGIC``, a 4-byte big-endian index length, the JSON index, then the
+part blobs at the offsets recorded in the index.
+"""
+
+import json
+import mmap
+import os
+import struct
+import threading
+import uuid
+from collections import OrderedDict
+
+MAGIC = b'MTPACK1\n'
+MAX_OPEN_PACKS = 64
+
+_HEADER = struct.Struct('>I')
+
+_open_packs = OrderedDict()
+_lock = threading.Lock()
+
+
+class Pack:
+    """A mapped pack: its JSON index and a read-only view of its part blobs."""
+
+    def __init__(self, path, index, buffer, data_offset):
+        self.path = path
+        self.index = index
+        # A view keeps the map alive, so a dropped pack stays mapped while a render holds its blobs
+        self._view = memoryview(buffer)
+        self._data_offset = data_offset
+
+    def blob(self, offset, length):
+        """Return a read-only view of the blob stored at ``offset`` in the data section, without copying it."""
+        start = self._data_offset + offset
+        return self._view[start:start + length]
+
+
+def write_pack(path, index, blobs):
+    """
+    Write a pack atomically. ``index`` is any JSON-serializable dict; each
+    blob's (offset, length) is appended to ``index['blobs']`` in order.
+    """
+    index = dict(index, blobs=[])
+    offset = 0
+    for blob in blobs:
+        index['blobs'].append((offset, len(blob)))
+        offset += len(blob)
+    encoded = json.dumps(index, separators=(',', ':')).encode('utf-8')
+
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(_HEADER.pack(len(encoded)))
+        f.write(encoded)
+        for blob in blobs:
+            f.write(blob)
+    os.replace(temp_path, path)
+
+
+def _map_pack(path):
+    with open(path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        header_end = len(MAGIC) + _HEADER.size
+        if buffer[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a template pack")
+        (index_length,) = _HEADER.unpack(buffer[len(MAGIC):header_end])
+        index = json.loads(buffer[header_end:header_end + index_length])
+        return Pack(path, index, buffer, header_end + index_length)
+    except Exception:
+        buffer.close()
+        raise
+
+
+def open_pack(path, family=None):
+    """
+    Return the mapped pack at ``path``, mapping it on first use.
+
+    Packs sharing a ``family`` (e.g. one template's versions) replace each
+    other: opening one unmaps the others. Raises OSError if the file is
+    missing and ValueError if it is not a pack.
+    """
+    with _lock:
+        entry = _open_packs.get(path)
+        if entry is not None:
+            _open_packs.move_to_end(path)
+            return entry[1]
+
+        pack = _map_pack(path)
+        stale = [other for other, (other_family, _) in _open_packs.items()
+                 if family is not None and other_family == family]
+        for other in stale:
+            del _open_packs[other]
+        _open_packs[path] = (family, pack)
+        while len(_open_packs) > MAX_OPEN_PACKS:
+            _open_packs.popitem(last=False)
+        return pack
+
+
+def forget_pack(path):
+    """Drop this process's map of a pack, e.g. after it turned out to be unreadable."""
+    with _lock:
+        _open_packs.pop(path, None)
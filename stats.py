@@ -0,0 +1,82 @@
+"""
+Per-template usage counters for the admin dashboard.
+
+The counters in ``template_stats`` are updated in the same transaction as the
+write they describe, with a single SQLite upsert each, so the dashboard never
+has to count ``created_document`` rows. ``flask --app app rebuild-stats``
+recomputes the document counts and last-used times from the table itself.
+Render times and PDF conversions are not recorded anywhere else and are kept
+as they are.
+"""
+
+from datetime import datetime, timezone
+
+import click
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert
+
+from models import db, CreatedDocument, Template, TemplateStats
+
+
+def _bump(template_id, **increments):
+    """Add to the counters of a template, creating its stats row if needed."""
+    values = {'template_id': template_id, 'document_count': 0, 'render_count': 0,
+              'render_seconds': 0.0, 'pdf_conversions': 0}
+    # A decrement on a missing row starts it at zero; rebuild-stats corrects any drift
+    values.update({name: max(amount, 0) if name != 'last_used_at' else amount
+                   for name, amount in increments.items()})
+    update = {name: getattr(TemplateStats, name) + amount for name, amount in increments.items()
+              if name != 'last_used_at'}
+    if 'last_used_at' in increments:
+        update['last_used_at'] = increments['last_used_at']
+    statement = insert(TemplateStats).values(**values)
+    db.session.execute(statement.on_conflict_do_update(index_elements=['template_id'], set_=update))
+
+
+def record_render(template_id, seconds):
+    """Count a generated document and its render time; committed with the document."""
+    _bump(template_id, document_count=1, render_count=1, render_seconds=seconds,
+          last_used_at=datetime.now(timezone.utc))
+
+
+def record_pdf_conversion(template_id):
+    """Count a successful DOCX to PDF conversion."""
+    _bump(template_id, pdf_conversions=1)
+
+
+def record_document_deleted(template_id):
+    """Keep the document count in step with a deleted document."""
+    _bump(template_id, document_count=-1)
+
+
+def dashboard_stats():
+    """Return ({template_id: TemplateStats}, total documents) in one query."""
+    stats = {row.template_id: row for row in TemplateStats.query.all()}
+    return stats, sum(row.document_count for row in stats.values())
+
+
+def rebuild_stats():
+    """Recompute document counts and last-used times from created_document."""
+    counts = dict(db.session.query(CreatedDocument.template_id, func.count(CreatedDocument.id))
+                  .group_by(CreatedDocument.template_id).all())
+    last_used = dict(db.session.query(CreatedDocument.template_id, func.max(CreatedDocument.created_at))
+                     .group_by(CreatedDocument.template_id).all())
+    existing = {row.template_id: row for row in TemplateStats.query.all()}
+    for (template_id,) in db.session.query(Template.id).all():
+        row = existing.pop(template_id, None)
+        if row is None:
+            row = TemplateStats(template_id=template_id, render_count=0, render_seconds=0.0, pdf_conversions=0)
+            db.session.add(row)
+        row.document_count = counts.get(template_id, 0)
+        row.last_used_at = last_used.get(template_id)
+    for orphan in existing.values():
+        db.session.delete(orphan)
+    db.session.commit()
+    return len(counts)
+
+
+@click.command('rebuild-stats')
+def rebuild_stats_command():
+    """Recompute the admin dashboard counters from the database."""
+    templates = rebuild_stats()
+    click.echo(f"Rebuilt statistics ({templates} templates with documents)")
@@ -0,0 +1,85 @@
+"""
+Layout of generated documents on disk.
+
+Documents are stored under ``GENERATED_FOLDER`` in one directory per day,
+``YYYY/MM/DD/<user>_<template>_<timestamp>_<token>.docx``. The token makes
+names unique even for two renders of the same user and template in the same
+second, and the day directories keep every directory small and let
+reconcile skip days that have not changed. ``CreatedDocument.file_path``
+holds the path relative to ``GENERATED_FOLDER``; rows written before this
+layout hold a bare file name in the top directory.
+
+Files are written under a temporary name in their final directory and
+renamed into place, so readers never see a partial document.
+"""
+
+import os
+import re
+import uuid
+
+# Directory levels below GENERATED_FOLDER: year, month, day
+SHARD_DEPTH = 3
+
+# The token before the extension, dropped from download names
+TOKEN_PATTERN = re.compile(r'_[0-9a-f]{8}(?=\.[a-z]+$)')
+
+
+def shard_directory(when):
+    """Return the relative directory of documents created at ``when``."""
+    return when.strftime('%Y/%m/%d')
+
+
+def document_path(user_name, template_name, when):
+    """Return a new, unique relative path for a generated document."""
+    name = f"{user_name}_{template_name}_{when:%Y%m%d_%H%M%S}_{uuid.uuid4().hex[:8]}.docx"
+    name = name.replace('/', '_').replace('\\', '_')
+    return f"{shard_directory(when)}/{name}"
+
+
+def display_name(file_path):
+    """Return the file name shown to users for a stored document or its PDF."""
+    return TOKEN_PATTERN.sub('', os.path.basename(file_path))
+
+
+def pdf_file_path(file_path):
+    """Return the path of the PDF converted from a stored .docx document."""
+    return f"{os.path.splitext(file_path)[0]}.pdf"
+
+
+def write_atomic(path, write):
+    """Call ``write(temp_path)`` and move the result to ``path``, creating its directory."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    temp_path = os.path.join(directory, f".{os.path.basename(path)}.{uuid.uuid4().hex}.tmp")
+    try:
+        write(temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def day_directories(folder):
+    """
+    Return ``{relative directory: mtime_ns}`` for every day directory, with
+    ``''`` for the top directory that holds documents from before sharding.
+
+    Adding or removing a file in a directory changes its mtime, so the
+    directories are only stat'ed here, never listed.
+    """
+    directories = {'': os.stat(folder).st_mtime_ns}
+
+    def walk(directory, prefix, depth):
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                # Hidden directories are PDF conversion scratch space, not shards
+                if entry.name.startswith('.') or not entry.is_dir(follow_symlinks=False):
+                    continue
+                if depth + 1 == SHARD_DEPTH:
+                    directories[prefix + entry.name] = entry.stat(follow_symlinks=False).st_mtime_ns
+                else:
+                    walk(entry.path, f"{prefix}{entry.name}/", depth + 1)
+
+    walk(folder, '', 0)
+    return directories
@@ -0,0 +1,181 @@
+"""
+First-page thumbnails of templates for the selection pages.
+
+A thumbnail is drawn with Pillow from the preview snapshot of a template
+version (see preview.py): the paragraphs' text, alignment and emphasis laid
+out on a page-shaped canvas, with placeholders highlighted. It is stored as
+one more artifact of the version, so its URL changes with the version and
+browsers may cache it for a year.
+
+Thumbnails are never drawn on the request path. Each worker process has one
+background thread that draws them after a template is uploaded or updated,
+or when a page asks for one that does not exist yet (that request gets a
+404). ``flask --app app build-thumbnails`` draws every missing thumbnail.
+Like the other artifacts, thumbnails are removed with their template by
+``remove_baked_templates`` and, if left behind, by ``reconcile``.
+"""
+
+import logging
+import os
+import re
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import current_app
+
+from artifacts import artifact_path
+from models import db, Template
+
+logger = logging.getLogger(__name__)
+
+# Page canvas (A4 at 72 dpi) and the stored thumbnail width
+PAGE_SIZE = (595, 842)
+MARGIN = 60
+FONT_SIZE = 11
+LINE_HEIGHT = 15
+THUMBNAIL_WIDTH = 240
+
+FONT_FILES = {False: 'DejaVuSerif.ttf', True: 'DejaVuSerif-Bold.ttf'}
+PLACEHOLDER_PATTERN = re.compile(r'\$\{[^}]+\}')
+PLACEHOLDER_FILL = (198, 232, 245)
+
+_executor = None
+_executor_pid = None
+_pending = set()
+_lock = threading.Lock()
+
+
+def thumbnail_path(template, template_file_path):
+    """Return the path of the thumbnail of a template version."""
+    return artifact_path(template, template_file_path, '.thumb.png')
+
+
+def _load_fonts():
+    from PIL import ImageFont
+    fonts = {}
+    for bold, name in FONT_FILES.items():
+        try:
+            fonts[bold] = ImageFont.truetype(name, FONT_SIZE)
+        except OSError:
+            # No DejaVu fonts installed: Pillow's built-in bitmap font
+            fonts[bold] = ImageFont.load_default()
+    return fonts
+
+
+def _wrap(text, font, width):
+    """Split text into lines no wider than ``width``."""
+    lines = []
+    for source_line in text.split('\n'):
+        line = ''
+        for word in source_line.split(' '):
+            candidate = f"{line} {word}" if line else word
+            if line and font.getlength(candidate) > width:
+                lines.append(line)
+                line = word
+            else:
+                line = candidate
+        lines.append(line)
+    return lines
+
+
+def draw_thumbnail(snapshot):
+    """Return a PIL image of the first page described by a preview snapshot."""
+    from PIL import Image, ImageDraw
+    page = Image.new('RGB', PAGE_SIZE, 'white')
+    draw = ImageDraw.Draw(page)
+    fonts = _load_fonts()
+    width = PAGE_SIZE[0] - 2 * MARGIN
+    y = MARGIN
+    for paragraph in snapshot['paragraphs']:
+        runs = paragraph['runs']
+        text = ''.join(run[0] for run in runs).replace('\t', '    ')
+        # A paragraph is drawn bold when most of its text is
+        bold_length = sum(len(run[0]) for run in runs if run[1])
+        font = fonts[bold_length * 2 > len(text)]
+        for line in _wrap(text, font, width):
+            if y + LINE_HEIGHT > PAGE_SIZE[1] - MARGIN:
+                return page.resize(_thumbnail_size(), Image.Resampling.LANCZOS)
+            line_width = font.getlength(line)
+            if paragraph['align'] == 'center':
+                x = MARGIN + (width - line_width) / 2
+            elif paragraph['align'] == 'right':
+                x = MARGIN + width - line_width
+            else:
+                x = MARGIN
+            for match in PLACEHOLDER_PATTERN.finditer(line):
+                start = x + font.getlength(line[:match.start()])
+                draw.rectangle((start, y - 1, start + font.getlength(match.group()), y + FONT_SIZE + 2),
+                               fill=PLACEHOLDER_FILL)
+            draw.text((x, y), line, fill='black', font=font)
+            y += LINE_HEIGHT
+        y += LINE_HEIGHT // 2
+    return page.resize(_thumbnail_size(), Image.Resampling.LANCZOS)
+
+
+def _thumbnail_size():
+    return THUMBNAIL_WIDTH, round(PAGE_SIZE[1] * THUMBNAIL_WIDTH / PAGE_SIZE[0])
+
+
+def build_thumbnail(template, template_file_path):
+    """Draw and store the thumbnail of a template version, unless it exists already."""
+    from preview import load_snapshot
+    path = thumbnail_path(template, template_file_path)
+    if os.path.exists(path):
+        return False
+    image = draw_thumbnail(load_snapshot(template, template_file_path))
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    image.save(temp_path, format='PNG', optimize=True)
+    os.replace(temp_path, path)
+    return True
+
+
+def _run(app, template_id):
+    try:
+        with app.app_context():
+            template = db.session.get(Template, template_id)
+            if template is None:
+                return
+            template_file_path = os.path.join(app.config['UPLOAD_FOLDER'], template.file_path)
+            if os.path.exists(template_file_path) and build_thumbnail(template, template_file_path):
+                path = thumbnail_path(template, template_file_path)
+                db.session.expire_all()
+                # Deleted while drawing: delete_template may have cleared baked/ before the file existed
+                if db.session.get(Template, template_id) is None and os.path.exists(path):
+                    os.remove(path)
+    except Exception as e:
+        logger.warning(f"Could not build thumbnail for template {template_id}: {str(e)}")
+    finally:
+        with _lock:
+            _pending.discard(template_id)
+
+
+def schedule_thumbnail(template_id):
+    """Draw a template's thumbnail in this worker's background thread."""
+    global _executor, _executor_pid
+    with _lock:
+        if template_id in _pending:
+            return
+        if _executor is None or _executor_pid != os.getpid():
+            # Threads do not survive a fork, so each worker process starts its own
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='thumbnails')
+            _executor_pid = os.getpid()
+            _pending.clear()
+        _pending.add(template_id)
+    _executor.submit(_run, current_app._get_current_object(), template_id)
+
+
+@click.command('build-thumbnails')
+def build_thumbnails_command():
+    """Draw the missing thumbnails of every template."""
+    built = 0
+    for template in Template.query.all():
+        template_file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], template.file_path)
+        if not os.path.exists(template_file_path):
+            continue
+        try:
+            built += build_thumbnail(template, template_file_path)
+        except Exception as e:
+            click.echo(f"Could not build thumbnail for {template.name}: {str(e)}")
+    click.echo(f"Built {built} thumbnails")
@@ -1,66 +1,124 @@
 #!/usr/bin/env python3
 """
-Database migration script to add new fields for batch processing
+Database migration script: upgrades the schema (see schema.py) and moves
+data stored by earlier versions. Run it once after every deployment.
 """
 
+import hashlib
+import shutil
 import sqlite3
 import os
+import uuid
+from datetime import datetime
 
-BASE_DIR = os.path.abspath(os.path.dirname(__file__))
-DB_PATH = os.path.join(BASE_DIR, 'db', 'db.sqlite')
+from formatting import detect_placeholder_type
+from storage import shard_directory
 
-def update_database():
-    """Update the database schema with new fields for batch processing"""
+def migrate_template_storage(conn, upload_folder):
+    """Move templates stored by file name to content-addressed <sha256>.docx files"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT DISTINCT file_path FROM template WHERE content_hash IS NULL")
+    moved = []
+    for (file_path,) in cursor.fetchall():
+        full_path = os.path.join(upload_folder, file_path)
+        if not os.path.exists(full_path):
+            print(f"Skipping missing template file {file_path}")
+            continue
+        digest = hashlib.sha256()
+        with open(full_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b''):
+                digest.update(chunk)
+        content_hash = digest.hexdigest()
+        hashed_name = f"{content_hash}.docx"
+        if not os.path.exists(os.path.join(upload_folder, hashed_name)):
+            shutil.copy2(full_path, os.path.join(upload_folder, hashed_name))
+        cursor.execute(
+            "UPDATE template SET file_path = ?, content_hash = ?, original_filename = ? "
+            "WHERE file_path = ? AND content_hash IS NULL",
+            (hashed_name, content_hash, file_path, file_path))
+        moved.append(full_path)
+        print(f"Stored {file_path} as {hashed_name}")
+    conn.commit()
+
+    # Old names are only removed once every row points at the hashed copy
+    for full_path in moved:
+        os.remove(full_path)
+
+def backfill_placeholder_types(conn):
+    """Store the type of placeholders created before typed placeholders, detected from their names"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, name FROM placeholder WHERE value_type IS NULL")
+    rows = [(detect_placeholder_type(name), placeholder_id) for placeholder_id, name in cursor.fetchall()]
+    cursor.executemany("UPDATE placeholder SET value_type = ? WHERE id = ?", rows)
+    conn.commit()
+    print(f"Typed {len(rows)} placeholders")
+
+def _link_or_copy(source, target):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # Add batch_id column to created_document table if it doesn't exist
-        try:
-            cursor.execute("ALTER TABLE created_document ADD COLUMN batch_id TEXT")
-            print("Added batch_id column to created_document table")
-        except sqlite3.OperationalError as e:
-            if "duplicate column name" in str(e).lower():
-                print("batch_id column already exists in created_document table")
-            else:
-                raise e
-        
-        # Create batch_generation table if it doesn't exist
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS batch_generation (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                batch_id TEXT UNIQUE NOT NULL,
-                user_name TEXT NOT NULL,
-                template_ids TEXT NOT NULL,
-                user_inputs TEXT NOT NULL,
-                zip_file_path TEXT,
-                status TEXT DEFAULT 'pending',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                completed_at TIMESTAMP
-            )
-        ''')
-        print("Created/verified batch_generation table")
-        
-        # Add font_name and font_size columns to placeholder table if they don't exist
-        try:
-            cursor.execute("ALTER TABLE placeholder ADD COLUMN font_name TEXT")
-            print("Added font_name column to placeholder table")
-        except sqlite3.OperationalError as e:
-            if "duplicate column name" in str(e).lower():
-                print("font_name column already exists in placeholder table")
-            else:
-                pass  # Ignore other errors for now
-        
-        try:
-            cursor.execute("ALTER TABLE placeholder ADD COLUMN font_size REAL")
-            print("Added font_size column to placeholder table")
-        except sqlite3.OperationalError as e:
-            if "duplicate column name" in str(e).lower():
-                print("font_size column already exists in placeholder table")
-            else:
-                pass  # Ignore other errors for now
-        
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+def migrate_generated_storage(conn, generated_folder, batch_size=500):
+    """Move generated documents stored flat in the generated folder into day directories, a batch of rows at a time"""
+    cursor = conn.cursor()
+    new_paths = {}  # old file name -> new relative path, for names shared by several rows
+    last_id = 0
+    moved = 0
+    while True:
+        cursor.execute("SELECT id, file_path, created_at FROM created_document "
+                       "WHERE id > ? AND file_path NOT LIKE '%/%' ORDER BY id LIMIT ?", (last_id, batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        updates = []
+        old_paths = []
+        for doc_id, file_path, created_at in rows:
+            last_id = doc_id
+            if file_path not in new_paths:
+                full_path = os.path.join(generated_folder, file_path)
+                if not os.path.exists(full_path):
+                    continue  # Left for the reconcile command
+                when = datetime.fromisoformat(created_at) if created_at else datetime.fromtimestamp(os.path.getmtime(full_path))
+                stem, extension = os.path.splitext(file_path)
+                new_path = f"{shard_directory(when)}/{stem}_{uuid.uuid4().hex[:8]}{extension}"
+                _link_or_copy(full_path, os.path.join(generated_folder, new_path))
+                old_paths.append(full_path)
+                pdf_path = os.path.join(generated_folder, f"{stem}.pdf")
+                if os.path.exists(pdf_path):
+                    _link_or_copy(pdf_path, os.path.join(generated_folder, f"{os.path.splitext(new_path)[0]}.pdf"))
+                    old_paths.append(pdf_path)
+                new_paths[file_path] = new_path
+            updates.append((new_paths[file_path], doc_id))
+        cursor.executemany("UPDATE created_document SET file_path = ? WHERE id = ?", updates)
         conn.commit()
+        moved += len(updates)
+
+        # Old names are only removed once the rows point at the new copies
+        for full_path in old_paths:
+            os.remove(full_path)
+    print(f"Moved {moved} generated documents into day directories")
+
+def update_database():
+    """Upgrade the schema, the counters and the search index, then migrate stored files and rows"""
+    # The app refuses a database behind the code, which is the state this script repairs
+    os.environ['SCHEMA_CHECK'] = '0'
+    from app import create_app
+    from schema import SCHEMA_VERSION, upgrade_database
+
+    try:
+        app = create_app()
+        with app.app_context():
+            created_tables = upgrade_database()
+        for table in sorted(created_tables):
+            print(f"Created {table} table")
+        print(f"Schema upgraded to version {SCHEMA_VERSION}")
+
+        conn = sqlite3.connect(app.config['DATABASE_PATH'])
+        migrate_template_storage(conn, app.config['UPLOAD_FOLDER'])
+        backfill_placeholder_types(conn)
+        migrate_generated_storage(conn, app.config['GENERATED_FOLDER'])
         conn.close()
         
         print("Database update completed successfully!")
@@ -73,4 +131,4 @@ def update_database():
 if __name__ == "__main__":
     success = update_database()
     if not success:
-        exit(1)
\ No newline at end of file
+        exit(1)
@@ -0,0 +1,157 @@
+"""
+Warm-up of a worker process and its readiness.
+
+Every cold cost of a fresh worker is paid by a background thread instead of
+the first users: the database connection, the rendering imports
+(python-docx, lxml, dateutil), loading each active template from its baked
+pack and rendering it once with sample values (which compiles the
+placeholder formatters and primes date parsing), the preview snapshots and
+a first LibreOffice conversion, which creates its profile and pulls it into
+the page cache.
+
+Warm-up starts with the first request a worker process receives, which is
+normally the proxy's first ``/readyz`` probe, so CLI commands and scripts
+that create the app never pay for it. ``/readyz`` answers 503 until it has
+finished and ``/healthz`` answers as soon as the process serves requests.
+A failed step is logged and skipped, except the database check, which
+leaves the worker unready and is retried on the next request.
+
+Settings: ``WARMUP`` (0 disables it, the worker is then ready at once),
+``WARMUP_TEMPLATES`` (most used active templates loaded) and ``WARMUP_PDF``
+(0 skips the LibreOffice start).
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date
+
+from flask import current_app
+from sqlalchemy import text
+
+from formatting import placeholder_type
+from models import db, Placeholder, Template, TemplateStats
+from pdf import convert_docx_to_pdf, converter_installed
+
+logger = logging.getLogger(__name__)
+
+# Values that go through every formatter without failing validation
+SAMPLE_VALUES = {
+    'text': 'Warm-up',
+    'date': date.today().isoformat(),
+    'address': '1 Warm-up Road, Benin City, Edo State',
+    'number': '1',
+}
+
+_state = {'pid': None, 'status': 'pending', 'steps': {}, 'seconds': None}
+_lock = threading.Lock()
+
+
+def warmup_status():
+    """Return this process's warm-up state: pending, warming, ready or failed, with step timings."""
+    with _lock:
+        if _state['pid'] != os.getpid():
+            return {'status': 'pending', 'steps': {}, 'seconds': None}
+        return dict(_state, steps=dict(_state['steps']))
+
+
+def start_warmup():
+    """Start this process's warm-up in the background unless it is running or done."""
+    app = current_app._get_current_object()
+    with _lock:
+        pid = os.getpid()
+        if _state['pid'] == pid and _state['status'] in ('warming', 'ready'):
+            return
+        # A forked worker inherits the parent's state but not its thread
+        _state.update(pid=pid, status='warming', steps={}, seconds=None)
+        if not app.config['WARMUP']:
+            _state['status'] = 'ready'
+            return
+    threading.Thread(target=_run, args=(app,), name='warmup', daemon=True).start()
+
+
+def _record(name, result):
+    with _lock:
+        _state['steps'][name] = result
+
+
+def _step(name, func, *args):
+    start = time.perf_counter()
+    try:
+        func(*args)
+    except Exception as e:
+        _record(name, 'failed')
+        logger.warning(f"Warm-up step {name} failed: {str(e)}")
+        return False
+    _record(name, round(time.perf_counter() - start, 4))
+    return True
+
+
+def _check_database():
+    db.session.execute(text('SELECT 1'))
+
+
+def _import_rendering():
+    import rendering  # noqa: F401 (python-docx, lxml and dateutil come with it)
+
+
+def _sample_inputs(placeholders):
+    return {ph.name: SAMPLE_VALUES.get(placeholder_type(ph), SAMPLE_VALUES['text']) for ph in placeholders}
+
+
+def _load_templates(limit):
+    """Load the most used active templates and render each once, without saving the result."""
+    from preview import load_snapshot
+    from rendering import render_document
+    templates = Template.query.outerjoin(TemplateStats, TemplateStats.template_id == Template.id)\
+        .filter(Template.is_active.is_(True))\
+        .order_by(db.func.coalesce(TemplateStats.render_count, 0).desc(), Template.id)\
+        .limit(limit).all()
+    for template in templates:
+        template_file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], template.file_path)
+        if not os.path.exists(template_file_path):
+            continue
+        placeholders = Placeholder.query.filter_by(template_id=template.id)\
+            .order_by(Placeholder.paragraph_index, Placeholder.start_run_index).all()
+        render_document(template_file_path, template, _sample_inputs(placeholders), placeholders)
+        load_snapshot(template, template_file_path)
+
+
+def _start_pdf_converter():
+    """Convert a one-line document so that LibreOffice's first start is not paid by a user."""
+    from docx import Document
+    scratch = tempfile.mkdtemp(prefix='mytypist-warmup-')
+    try:
+        docx_path = os.path.join(scratch, 'warmup.docx')
+        document = Document()
+        document.add_paragraph('Warm-up')
+        document.save(docx_path)
+        if not convert_docx_to_pdf(docx_path, os.path.join(scratch, 'warmup.pdf')):
+            raise RuntimeError("conversion failed")
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def _run(app):
+    start = time.perf_counter()
+    with app.app_context():
+        try:
+            if not _step('database', _check_database):
+                with _lock:
+                    _state['status'] = 'failed'
+                return
+            _step('imports', _import_rendering)
+            _step('templates', _load_templates, app.config['WARMUP_TEMPLATES'])
+            if app.config['WARMUP_PDF'] and converter_installed():
+                _step('pdf', _start_pdf_converter)
+            elif app.config['WARMUP_PDF']:
+                _record('pdf', 'skipped')
+            with _lock:
+                _state['seconds'] = round(time.perf_counter() - start, 4)
+                _state['status'] = 'ready'
+            logger.info(f"Worker {os.getpid()} warmed up in {_state['seconds']:.2f}s: {_state['steps']}")
+        finally:
+            db.session.remove()